@@ -1,34 +1,98 @@
 import nbformat
+import nbconvert
 from nbconvert import HTMLExporter
 from nbconvert.preprocessors import ExecutePreprocessor
 from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor, as_completed
 import argparse
+import hashlib
+import json
+import time
 
-def main(path):
+# Hashes of the notebooks used to create the current previews, saved in the output directory
+HASHES_FILE = ".preview-hashes.json"
+
+# Each worker process creates one exporter, so the templates are only loaded once
+_exporter = None
+
+
+def get_exporter():
+    global _exporter
+    if _exporter is None:
+        _exporter = HTMLExporter()
+    return _exporter
+
+
+def hash_notebook(nb_path):
+    """
+    Hash the contents of a notebook, along with the nbconvert version used to render it.
+    """
+    nb_hash = hashlib.sha256(nb_path.read_bytes())
+    nb_hash.update(nbconvert.__version__.encode())
+    return nb_hash.hexdigest()
+
+
+def render_preview(nb_path, preview_path):
+    """
+    Save a notebook as HTML, returning the time taken.
+    """
+    start = time.perf_counter()
+    with nb_path.open() as f:
+        nb = nbformat.read(f, as_version=4)
+        #ep = ExecutePreprocessor(skip_cells_with_tag="nbval-skip")
+        #ep.preprocess(nb, {'metadata': {'path': '.'}})
+        (body, resources) = get_exporter().from_notebook_node(nb)
+        preview_path.write_text(body)
+    return time.perf_counter() - start
+
+
+def main(path, workers=None, force=False):
     if path:
         output = Path(path, "previews")
     else:
         output = Path("previews")
     output.mkdir(exist_ok=True)
+    hashes_path = Path(output, HASHES_FILE)
+    hashes = json.loads(hashes_path.read_text()) if hashes_path.exists() else {}
 
     nbs = [n for n in Path(".").glob("*.ipynb") if not n.name.startswith(("index", "draft", "Untitled", "snippets"))]
+    # Only render notebooks that have changed since their preview was created
+    changed = {}
     for nb_path in nbs:
-        print(nb_path.name)
-        with nb_path.open() as f:
-            nb = nbformat.read(f, as_version=4)
-            #ep = ExecutePreprocessor(skip_cells_with_tag="nbval-skip")
-            #ep.preprocess(nb, {'metadata': {'path': '.'}})
-            html_exporter = HTMLExporter()
+        nb_hash = hash_notebook(nb_path)
+        preview_path = Path(output, f"{nb_path.stem}.html")
+        if not force and preview_path.exists() and hashes.get(nb_path.name) == nb_hash:
+            print(f"{nb_path.name}: unchanged")
+        else:
+            changed[nb_path] = nb_hash
 
-            # 3. Process the notebook we loaded earlier
-            (body, resources) = html_exporter.from_notebook_node(nb)
-
-            Path(output, f"{nb_path.stem}.html").write_text(body)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            executor.submit(render_preview, nb_path, Path(output, f"{nb_path.stem}.html")): nb_path
+            for nb_path in changed
+        }
+        for future in as_completed(futures):
+            nb_path = futures[future]
+            try:
+                render_time = future.result()
+            except Exception as e:
+                print(f"{nb_path.name}: failed ({e})")
+            else:
+                print(f"{nb_path.name}: {render_time:.1f}s")
+                hashes[nb_path.name] = changed[nb_path]
+                # Save after each preview, so an interrupted run doesn't lose completed work
+                hashes_path.write_text(json.dumps(hashes, indent=2, sort_keys=True))
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument(
         "--path", type=str, help="Path to save", required=False
     )
+    parser.add_argument(
+        "--workers", type=int, help="Number of notebooks to render at once (defaults to the number of CPUs)", required=False
+    )
+    parser.add_argument(
+        "--force", action="store_true", help="Render every notebook, even if it hasn't changed"
+    )
     args = parser.parse_args()
-    main(args.path)
+    main(args.path, workers=args.workers, force=args.force)
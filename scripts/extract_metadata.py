@@ -1,6 +1,7 @@
-import nbformat
 import re
 
+from notebook_index import get_index
+
 LISTIFY = ["author", "object", "result"]
 
 
@@ -28,8 +29,7 @@ def extract_notebook_metadata(notebook, keys):
         A dictionary containing the retrieved metadata for each key.
     """
     result = {}
-    nb = nbformat.read(notebook, nbformat.NO_CONVERT)
-    metadata = nb.metadata.rocrate
+    metadata = get_index().get_metadata(notebook)
     for key, default in keys.items():
         if key in LISTIFY:
             result[key] = listify(metadata.get(key, default))
@@ -0,0 +1,134 @@
+import ast
+import importlib.metadata
+import json
+import re
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from notebook_index import get_index
+
+# The index of installed distributions is saved in the root of the repository
+DISTRIBUTIONS_PATH = Path(
+    Path(__file__).resolve().parent.parent, ".distributions_index.json"
+)
+
+# IPython magics and shell commands aren't valid Python
+MAGIC = re.compile(r"^\s*[%!?]", flags=re.MULTILINE)
+
+
+def find_imports(source):
+    """
+    Find the top-level names of modules imported by some Python code.
+    Relative imports are ignored.
+    """
+    source = MAGIC.sub("#", source)
+    try:
+        tree = ast.parse(source)
+    except SyntaxError:
+        return set()
+    imports = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            imports.update(alias.name.split(".")[0] for alias in node.names)
+        elif isinstance(node, ast.ImportFrom) and node.level == 0 and node.module:
+            imports.add(node.module.split(".")[0])
+    return imports
+
+
+def find_cell_imports(cells):
+    imports = set()
+    for source in cells:
+        imports.update(find_imports(source))
+    return sorted(imports)
+
+
+def get_notebook_imports(notebooks, index=None):
+    """
+    Get the modules imported by a list of notebooks. Imports are saved in the
+    notebook index, so notebooks are only parsed again if they've changed.
+    Notebooks that need parsing are shared between multiple processes.
+    """
+    index = index or get_index()
+    entries = [index.get(nb) for nb in notebooks]
+    missing = [entry for entry in entries if "imports" not in entry]
+    if missing:
+        with ProcessPoolExecutor() as executor:
+            cells = [entry["code"] for entry in missing]
+            for entry, imports in zip(missing, executor.map(find_cell_imports, cells)):
+                entry["imports"] = imports
+        index.changed = True
+        index.save()
+    return sorted(set().union(*[entry["imports"] for entry in entries]))
+
+
+def get_module_imports(paths):
+    """
+    Get the modules imported by a list of Python files.
+    """
+    imports = set()
+    for path in paths:
+        imports.update(find_imports(Path(path).read_text()))
+    return sorted(imports)
+
+
+def get_local_modules(root):
+    """
+    Get the names of the packages and scripts that are part of the repository, so
+    they aren't listed as requirements.
+    """
+    packages = [init.parent.name for init in Path(root).glob("*/__init__.py")]
+    scripts = [py.stem for py in Path(root, "scripts").glob("*.py")]
+    return sorted(set(packages + scripts))
+
+
+def get_environment_signature():
+    """
+    Identify the current state of the Python environment, using the modification
+    times of the directories packages are installed in.
+    """
+    paths = [
+        Path(p)
+        for p in sys.path
+        if ("site-packages" in p or "dist-packages" in p) and Path(p).is_dir()
+    ]
+    return [sys.executable] + [f"{p}:{p.stat().st_mtime_ns}" for p in paths]
+
+
+def get_distributions():
+    """
+    Get a dict that maps top-level module names to the names of the installed
+    distributions that provide them. The results are saved, and only rebuilt
+    when packages are installed or removed.
+    """
+    signature = get_environment_signature()
+    if DISTRIBUTIONS_PATH.exists():
+        saved = json.loads(DISTRIBUTIONS_PATH.read_text())
+        if saved["signature"] == signature:
+            return saved["modules"]
+    modules = importlib.metadata.packages_distributions()
+    DISTRIBUTIONS_PATH.write_text(
+        json.dumps({"signature": signature, "modules": modules})
+    )
+    return modules
+
+
+def resolve_imports(imports):
+    """
+    Find the installed distributions that provide a list of imported modules.
+    Modules from the standard library are ignored.
+
+    Returns:
+        A list of distribution names, and a list of modules that couldn't be found
+    """
+    distributions = get_distributions()
+    requirements = []
+    unresolved = []
+    for module in imports:
+        if module in sys.stdlib_module_names:
+            continue
+        elif dists := distributions.get(module):
+            requirements += [d for d in dists if d not in requirements]
+        else:
+            unresolved.append(module)
+    return requirements, unresolved
@@ -1,41 +1,31 @@
 from pathlib import Path
-import json
-import re
-import importlib.util
-import os.path
-import sys
+
+from import_scanner import get_local_modules, get_module_imports, get_notebook_imports, resolve_imports
 
 external_imports = ['jupyterlab', 'voila', 'voila-material @ git+https://github.com/GLAM-Workbench/voila-material.git']
 
-python_path = os.path.dirname(sys.executable).replace('bin', 'lib')
-#print(python_path)
-
-imports = []
-for nb in Path(__file__).resolve().parent.parent.glob('*.ipynb'):
-    if not nb.name.startswith('.') and not nb.name.startswith('Untitled'):
-        nb_json = json.loads(nb.read_bytes())
-        for cell in nb_json['cells']:
-            for line in cell['source']:
-                if match := re.search(r'^\s*import ([a-zA-Z_]+)(?! from)', line):
-                    imports.append(match.group(1))
-                elif match := re.search(r'^\s*from ([a-zA-Z_]+)\.?[a-zA-Z_]* import [a-zA-Z_]+', line):
-                    imports.append(match.group(1))
-
-# print(list(set(imports)))
-
-for imported_mod in list(set(imports)):
-    try:
-        module_path = importlib.util.find_spec(imported_mod).origin
-    except AttributeError:
-        pass
-    else:
-        if module_path:
-            # print(imported_mod)
-            # print(module_path)
-            if 'site-packages' in module_path or python_path in module_path:
-                external_imports.append(imported_mod)
-    #print(external_imports)
-
-with Path(Path(__file__).resolve().parent.parent, 'requirements-tocheck.in').open('w') as req_file:
-    for mod in external_imports:
-        req_file.write(mod + '\n')
+
+def main():
+    root = Path(__file__).resolve().parent.parent
+    notebooks = [
+        nb for nb in root.glob('*.ipynb')
+        if not nb.name.startswith('.') and not nb.name.startswith('Untitled')
+    ]
+    # Include the dependencies of the repository's own packages
+    local_modules = get_local_modules(root)
+    modules = [py for name in local_modules for py in Path(root, name).glob('**/*.py')]
+    imports = set(get_notebook_imports(notebooks)) | set(get_module_imports(modules))
+    requirements, unresolved = resolve_imports(sorted(imports - set(local_modules)))
+    requirements = external_imports + requirements
+
+    # Modules that aren't installed need to be checked by hand
+    if unresolved:
+        print(f"Not installed: {', '.join(unresolved)}")
+
+    with Path(root, 'requirements-tocheck.in').open('w') as req_file:
+        for mod in requirements:
+            req_file.write(mod + '\n')
+
+
+if __name__ == '__main__':
+    main()
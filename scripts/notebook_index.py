@@ -0,0 +1,108 @@
+import json
+import re
+from pathlib import Path
+
+# The index is saved in the root of the repository
+INDEX_PATH = Path(Path(__file__).resolve().parent.parent, ".notebook_index.json")
+
+
+def join_source(source):
+    if isinstance(source, list):
+        return "".join(source)
+    return source
+
+
+def extract_title(markdown_cells):
+    for source in markdown_cells:
+        if title := re.search(r"^# (.+)(\n|$)", source):
+            return title.group(1)
+
+
+def read_notebook(notebook):
+    """
+    Read the parts of a notebook the scripts need, leaving out cell outputs.
+
+    Parameters:
+        notebook: path to the notebook
+
+    Returns:
+        A dict with the notebook's `metadata`, `title` (from the first markdown heading)
+        and the source of each code cell (`code`).
+    """
+    nb_json = json.loads(Path(notebook).read_bytes())
+    markdown = []
+    code = []
+    for cell in nb_json.get("cells", []):
+        if cell["cell_type"] == "markdown":
+            markdown.append(join_source(cell["source"]))
+        elif cell["cell_type"] == "code":
+            code.append(join_source(cell["source"]))
+    return {
+        "metadata": nb_json.get("metadata", {}),
+        "title": extract_title(markdown),
+        "code": code,
+    }
+
+
+class NotebookIndex:
+    """
+    An index of notebook metadata, titles and code, so each script doesn't have to
+    parse complete notebooks (including their outputs) every time it runs.
+    Notebooks are only read again if their size or modification time changes.
+    """
+
+    def __init__(self, path=INDEX_PATH):
+        self.path = Path(path) if path else None
+        self.notebooks = {}
+        self.changed = False
+        if self.path and self.path.exists():
+            try:
+                self.notebooks = json.loads(self.path.read_text())
+            except json.JSONDecodeError:
+                self.notebooks = {}
+
+    def get(self, notebook):
+        """
+        Get the indexed details of a notebook, reading it if it's new or has changed.
+        """
+        notebook = Path(notebook).resolve()
+        stats = notebook.stat()
+        entry = self.notebooks.get(str(notebook))
+        if (
+            not entry
+            or entry["mtime"] != stats.st_mtime_ns
+            or entry["size"] != stats.st_size
+        ):
+            entry = {"mtime": stats.st_mtime_ns, "size": stats.st_size}
+            entry.update(read_notebook(notebook))
+            self.notebooks[str(notebook)] = entry
+            self.changed = True
+        return entry
+
+    def get_metadata(self, notebook):
+        """
+        Get the RO-Crate metadata embedded in a notebook.
+        """
+        return self.get(notebook)["metadata"].get("rocrate", {})
+
+    def save(self):
+        if self.path and self.changed:
+            # Remove notebooks that no longer exist
+            self.notebooks = {
+                k: v for k, v in self.notebooks.items() if Path(k).exists()
+            }
+            self.path.write_text(json.dumps(self.notebooks))
+            self.changed = False
+
+
+_index = None
+
+
+def get_index():
+    """
+    Get the shared notebook index, loading it if necessary.
+    """
+    global _index
+    if _index is None:
+        _index = NotebookIndex()
+    return _index
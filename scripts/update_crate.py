@@ -8,16 +8,23 @@ from git import Repo
 from git.exc import InvalidGitRepositoryError, GitCommandError
 import json
 import argparse
+import copy
+import csv
 import datetime
-import nbformat
+import hashlib
 import sys
-import requests
+import requests_cache
+from requests.adapters import HTTPAdapter
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from bs4 import BeautifulSoup
 from github import Github
 import re
 import arrow
+import numpy as np
 import git
 
+from notebook_index import get_index
+
 LICENCES = json.loads(Path("scripts", "licences.json").read_text())
 CONTEXT_PROPERTIES = [
     "author",
@@ -30,12 +37,28 @@ CONTEXT_PROPERTIES = [
     "isPartOf",
     "license"
 ]
-
-
-def main(crate_path, defaults, version, data_repo):
+# Number of remote requests to make at the same time
+MAX_WORKERS = 8
+REQUEST_TIMEOUT = 30
+# Web pages are saved here, and revalidated using conditional requests (ETag/Last-Modified)
+REMOTE_CACHE = Path(".crate_cache")
+REMOTE_CACHE_EXPIRY = datetime.timedelta(days=1)
+# Fingerprints of local files are saved alongside the crate metadata
+FINGERPRINTS_FILE = "ro-crate-fingerprints.json"
+# Data files are read in chunks of this size when counting records
+COUNT_CHUNK_SIZE = 4 * 1024 * 1024
+# Files bigger than this are split between multiple processes when counting records
+COUNT_PARALLEL_SIZE = 512 * 1024 * 1024
+# Characters before the opening quote, and after the closing quote, of a quoted CSV value
+# (as lookup tables of byte values)
+FIELD_STARTS = np.isin(np.arange(256), [ord(","), ord("\n")])
+FIELD_ENDS = np.isin(np.arange(256), [ord(","), ord("\r"), ord("\n")])
+
+
+def main(crate_path, defaults, version, data_repo, full=False):
     # Make working directory the parent of the scripts directory
     os.chdir(Path(__file__).resolve().parent.parent)
-    crate_maker = CrateMaker(crate_path, defaults=defaults, version=version, data_repo=data_repo)
+    crate_maker = CrateMaker(crate_path, defaults=defaults, version=version, data_repo=data_repo, full=full)
     # Update the crate
     crate_maker.update_crate()
 
@@ -53,15 +76,294 @@ def delistify(value):
         return value
 
 
+def hash_file(path):
+    file_hash = hashlib.sha256()
+    with Path(path).open("rb") as f:
+        while chunk := f.read(1024 * 1024):
+            file_hash.update(chunk)
+    return file_hash.hexdigest()
+
+
+def quote_states(opens, closes):
+    """
+    Follow the quoted state through a series of runs of quotes. A run that can only open
+    a quoted value has no effect if the state is already inside one (and the same for runs
+    that can only close a value), while a run that can do both always changes the state.
+
+    Parameters:
+        opens: a boolean array, True for runs that can open a quoted value
+        closes: a boolean array, True for runs that can close a quoted value
+
+    Returns:
+        A boolean array, True where the state is inside a quoted value after each run
+        (if it started outside one), and the number of runs before the first run that
+        can only open or close a value (the state only depends on the starting state
+        up to there)
+    """
+    flips = opens & closes
+    sets = opens ^ closes
+    # The state after each run depends on the last run that could only open or close a
+    # value, and the number of runs that could do both since then
+    last_set = np.maximum.accumulate(np.where(sets, np.arange(len(sets)), -1))
+    flip_counts = np.cumsum(flips)
+    known = last_set >= 0
+    last_set = np.maximum(last_set, 0)
+    base = known & opens[last_set]
+    flipped = flip_counts - np.where(known, flip_counts[last_set], 0)
+    return base ^ (flipped % 2 == 1), int(np.argmax(sets)) if sets.any() else len(sets)
+
+
+def count_chunk(chunk, quoted=True, previous=b"\n"):
+    """
+    Count the line breaks in a chunk of a data file.
+    If `quoted` is True, line breaks inside quoted CSV values aren't counted.
+    As the chunk might start inside a quoted value, the counts are returned for both
+    cases, along with whether the chunk ends inside a quoted value.
+    `previous` is the byte before the chunk, and the chunk shouldn't end in the middle of
+    a run of quotes (except at the end of the file).
+
+    Returns:
+        A tuple (breaks, ends inside quotes) for a chunk that starts outside quotes,
+        followed by the same for a chunk that starts inside quotes
+    """
+    if not quoted or b'"' not in chunk:
+        breaks = chunk.count(b"\n")
+        return breaks, False, 0 if quoted else breaks, quoted
+    data = np.frombuffer(chunk, dtype=np.uint8)
+    # Find runs of consecutive quotes from the positions where quotes start and stop
+    is_quote = data == ord('"')
+    changes = np.flatnonzero(is_quote[1:] != is_quote[:-1]) + 1
+    if is_quote[0]:
+        changes = np.insert(changes, 0, 0)
+    if is_quote[-1]:
+        changes = np.append(changes, len(data))
+    starts = changes[0::2]
+    ends = changes[1::2]
+    # Escaped quotes ("") come in pairs, so only runs with an odd number of quotes open
+    # or close a quoted value. An opening quote has to be at the start of a field, and a
+    # closing quote at the end of one, otherwise they're just part of an unquoted value
+    # (eg 5" screen, or a value that ends with an inch mark). The end of the file is
+    # treated as the end of a field.
+    odd = (ends - starts) % 2 == 1
+    before = data[np.maximum(starts - 1, 0)]
+    before[starts == 0] = ord(previous)
+    after = data[np.minimum(ends, len(data) - 1)]
+    after[ends == len(data)] = ord(",")
+    opens = odd & FIELD_STARTS[before]
+    closes = odd & FIELD_ENDS[after]
+    runs = opens | closes
+    states, first_set = quote_states(opens[runs], closes[runs])
+    # The state before each line break is the state after the last run before it
+    preceding = np.searchsorted(starts[runs], np.flatnonzero(data == ord("\n")))
+    states = np.insert(states, 0, False)
+    breaks_inside = states[preceding]
+    outside_breaks = len(preceding) - int(np.count_nonzero(breaks_inside))
+    # Starting inside a quoted value only changes the state up to the first run that
+    # can only open or close a value
+    changed = preceding <= first_set
+    inside_breaks = outside_breaks - int(np.count_nonzero(~breaks_inside[changed]))
+    inside_breaks += int(np.count_nonzero(breaks_inside[changed]))
+    inside_end = bool(states[-1]) ^ (first_set == len(states) - 1)
+    return outside_breaks, bool(states[-1]), inside_breaks, inside_end
+
+
+def combine_counts(counts):
+    """
+    Combine the results of `count_chunk()` for a series of consecutive chunks.
+    """
+    results = ()
+    for start_inside in [False, True]:
+        breaks = 0
+        inside = start_inside
+        for outside_breaks, outside_end, inside_breaks, inside_end in counts:
+            if inside:
+                breaks += inside_breaks
+                inside = inside_end
+            else:
+                breaks += outside_breaks
+                inside = outside_end
+        results += (breaks, inside)
+    return results
+
+
+def count_range(path, start, end, quoted=True):
+    """
+    Count the line breaks in part of a file, reading it in binary chunks.
+    """
+    counts = []
+    with Path(path).open("rb") as f:
+        previous = b"\n"
+        if start:
+            f.seek(start - 1)
+            previous = f.read(1)
+        remaining = end - start
+        while remaining > 0 and (chunk := f.read(min(COUNT_CHUNK_SIZE, remaining))):
+            remaining -= len(chunk)
+            # Keep runs of quotes together, so escaped quotes aren't split between chunks
+            while remaining > 0 and chunk.endswith(b'"'):
+                chunk += f.read(1)
+                remaining -= 1
+            counts.append(count_chunk(chunk, quoted=quoted, previous=previous))
+            previous = chunk[-1:]
+    return combine_counts(counts)
+
+
+def skip_quotes(path, position):
+    """
+    Move a position in a file forward until it's not just after a quote, so that
+    splitting the file there doesn't split a run of quotes.
+    """
+    with Path(path).open("rb") as f:
+        f.seek(max(position - 1, 0))
+        while position and f.read(1) == b'"':
+            position += 1
+    return position
+
+
+def count_csv_records(path):
+    """
+    Count the records in a CSV file using the csv module (slower, but handles any quoting).
+    """
+    csv.field_size_limit(sys.maxsize)
+    with Path(path).open("r", newline="", encoding="utf-8", errors="replace") as f:
+        return sum(1 for _ in csv.reader(f))
+
+
+def count_records(path, quoted=None, parallel_size=COUNT_PARALLEL_SIZE):
+    """
+    Count the records in a CSV or NDJSON file (including any header row).
+    Line breaks inside quoted CSV values don't start a new record.
+    Large files are split into ranges and counted by multiple processes.
+
+    Parameters:
+        path: path to the file
+        quoted: check for quoted values (defaults to True for CSV files)
+        parallel_size: files bigger than this are counted in parallel
+
+    Returns:
+        The number of records
+    """
+    path = Path(path)
+    if quoted is None:
+        quoted = path.suffix.lower() == ".csv"
+    size = path.stat().st_size
+    if not size:
+        return 0
+    workers = os.cpu_count() or 1
+    if size > parallel_size and workers > 1:
+        step = -(-size // workers)
+        starts = [0] + [
+            min(skip_quotes(path, start), size) for start in range(step, size, step)
+        ]
+        ends = starts[1:] + [size]
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            counts = list(
+                executor.map(
+                    count_range,
+                    [path] * len(starts),
+                    starts,
+                    ends,
+                    [quoted] * len(starts),
+                )
+            )
+        records, unclosed = combine_counts(counts)[:2]
+    else:
+        records, unclosed = count_range(path, 0, size, quoted=quoted)[:2]
+    if unclosed:
+        # A quoted value was never closed, so the quotes couldn't be matched up
+        # (eg a stray quote at the start of an unquoted value). Let the csv module decide.
+        return count_csv_records(path)
+    # Count the last record if it doesn't end with a line break
+    with path.open("rb") as f:
+        f.seek(-1, os.SEEK_END)
+        if f.read(1) != b"\n":
+            records += 1
+    return records
+
+
+class Fingerprints:
+    """
+    Keeps values derived from local files (eg the number of rows in a CSV file)
+    between runs, so they only have to be recalculated when a
+    file changes. Files are identified by their path, size, modification time and content
+    hash. The hash is only checked if the modification time has changed, so files that are
+    touched but not changed (eg by a git checkout) aren't processed again.
+    """
+
+    def __init__(self, path=None):
+        self.path = Path(path) if path else None
+        self.files = {}
+        if self.path and self.path.exists():
+            self.files = json.loads(self.path.read_text())
+
+    def get(self, file_path, name, calculate):
+        """
+        Get a value derived from a file, only calling `calculate()` if the file has changed.
+        """
+        file_stats = Path(file_path).stat()
+        entry = self.files.get(str(file_path))
+        if entry and entry["size"] == file_stats.st_size and name in entry["values"]:
+            if entry["mtime"] == file_stats.st_mtime_ns:
+                return entry["values"][name]
+            if entry["hash"] == hash_file(file_path):
+                entry["mtime"] = file_stats.st_mtime_ns
+                return entry["values"][name]
+        value = calculate()
+        if not entry or entry["size"] != file_stats.st_size or entry["mtime"] != file_stats.st_mtime_ns:
+            # The file has changed, so any other saved values are out of date
+            entry = {
+                "size": file_stats.st_size,
+                "mtime": file_stats.st_mtime_ns,
+                "hash": hash_file(file_path),
+                "values": {},
+            }
+            self.files[str(file_path)] = entry
+        entry["values"][name] = value
+        return value
+
+    def save(self):
+        if self.path:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self.path.write_text(json.dumps(self.files, indent=2, sort_keys=True))
+
+
 class CrateMaker:
 
-    def __init__(self, crate_path="./", defaults=None, version=None, data_repo=None):
+    def __init__(self, crate_path="./", defaults=None, version=None, data_repo=None, full=False):
         # Make working directory the parent of the scripts directory
         os.chdir(Path(__file__).resolve().parent.parent)
         self.defaults = defaults
         self.crate_path = crate_path
         self.version = version
         self.data_repo = data_repo
+        self.full = full
+        # Values derived from local data files, replaced with saved fingerprints in update_crate()
+        self.fingerprints = Fingerprints()
+        self.notebook_index = get_index()
+        # Remote lookups are memoised, so each repo, file and page is only fetched once
+        self.session = self.create_session()
+        self.github = Github(pool_size=MAX_WORKERS)
+        self.gh_repos = {}
+        self.web_file_stats = {}
+        self.page_titles = {}
+        self.repo_info = None
+
+    def create_session(self):
+        """
+        Create a session that reuses connections and caches responses on disk.
+        """
+        session = requests_cache.CachedSession(
+            str(REMOTE_CACHE),
+            backend="sqlite",
+            expire_after=REMOTE_CACHE_EXPIRY,
+            always_revalidate=True,
+            # HEAD requests have no body to save, so they're always sent
+            allowable_methods=("GET",),
+        )
+        adapter = HTTPAdapter(pool_connections=MAX_WORKERS, pool_maxsize=MAX_WORKERS)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        return session
 
     def id_ify(self, elements):
         """Wraps elements in a list with @id keys
@@ -204,13 +506,10 @@ class CrateMaker:
             page = self.add_context_entity(props)
         # Update the context entity with additional properties from page data
         page = self.update_properties(page, page_data)
-        # If there's a specific name in an existing record we want to keep it.
+        # If there's a specific name in page data or an existing record we want to keep it.
         # Otherwise add a default name from the page title
-        default_name = self.get_page_title(page_data["url"])
-        if "name" in page_data and page.get("name") == default_name:
-            page["name"] = page_data["name"]
-        elif not page.get("name"):
-            page["name"] = default_name
+        if not page.get("name"):
+            page["name"] = self.get_page_title(page_data["url"])
         return page
 
     def add_pages(self, pages, type="CreativeWork"):
@@ -271,27 +570,28 @@ class CrateMaker:
             stats["contentSize"] = file_stats.st_size
             stats["dateModified"] = arrow.get(file_stats.st_mtime).isoformat()
             if local_file.name.endswith((".csv", ".ndjson")):
-                stats["size"] = 0
-                with local_file.open("r") as df:
-                    for line in df:
-                        stats["size"] += 1
+                stats["size"] = self.fingerprints.get(
+                    local_file, "records", lambda: count_records(local_file)
+                )
         return stats
 
     def get_web_file_stats(self, url):
-        stats = {"sdDatePublished": arrow.utcnow().isoformat()}
-        if "github" in url:
-            repo = self.get_gh_repo(url)
-            file_path = url.split(f"/{repo.default_branch}/")[-1]
-            contents = repo.get_contents(file_path)
-            stats["contentSize"] = contents.size
-            stats["dateModified"] = contents.last_modified_datetime.isoformat()
-        else:
-            response = requests.head(url)
-            stats["contentSize"] = response.headers.get("Content-length")
-            stats["dateModified"] = arrow.get(
-                response.headers.get("Last-Modified"), "ddd, D MMM YYYY HH:mm:ss ZZZ"
-            ).isoformat()
-        return stats
+        if url not in self.web_file_stats:
+            stats = {"sdDatePublished": arrow.utcnow().isoformat()}
+            if "github" in url:
+                repo = self.get_gh_repo(url)
+                file_path = url.split(f"/{repo.default_branch}/")[-1]
+                contents = repo.get_contents(file_path)
+                stats["contentSize"] = contents.size
+                stats["dateModified"] = contents.last_modified_datetime.isoformat()
+            else:
+                response = self.session.head(url, timeout=REQUEST_TIMEOUT)
+                stats["contentSize"] = response.headers.get("Content-length")
+                stats["dateModified"] = arrow.get(
+                    response.headers.get("Last-Modified"), "ddd, D MMM YYYY HH:mm:ss ZZZ"
+                ).isoformat()
+            self.web_file_stats[url] = stats
+        return dict(self.web_file_stats[url])
 
     def get_gh_parts(self, url):
         try:
@@ -306,14 +606,18 @@ class CrateMaker:
     def get_gh_repo(self, url):
         owner, repo = self.get_gh_parts(url)
         if owner and repo:
-            g = Github()
-            return g.get_repo(full_name_or_id=f"{owner}/{repo}")
+            full_name = f"{owner}/{repo}"
+            if full_name not in self.gh_repos:
+                self.gh_repos[full_name] = self.github.get_repo(full_name_or_id=full_name)
+            return self.gh_repos[full_name]
 
     def get_gh_path(self, url):
         default_branch = self.get_default_gh_branch(url)
         return url.split(f"/{default_branch}/")[-1]
 
     def get_repo_info(self):
+        if self.repo_info:
+            return self.repo_info
         # Try to get some info from the local git repo
         try:
             repo = git.Repo(".")
@@ -325,7 +629,8 @@ class CrateMaker:
         except (InvalidGitRepositoryError, GitCommandError):
             repo_url = ""
             repo_name = "example-repo"
-        return repo_name, repo_url
+        self.repo_info = (repo_name, repo_url)
+        return self.repo_info
 
     def get_repo_link(self, entry):
         """
@@ -476,14 +781,66 @@ class CrateMaker:
         """
         Get title of the page at the supplied url.
         """
-        response = requests.get(url)
-        if response.ok:
-            soup = BeautifulSoup(response.text, features="lxml")
-            return soup.title.string.strip()
+        if url not in self.page_titles:
+            title = None
+            response = self.session.get(url, timeout=REQUEST_TIMEOUT)
+            if response.ok:
+                soup = BeautifulSoup(response.text, features="lxml")
+                title = soup.title.string.strip()
+            self.page_titles[url] = title
+        return self.page_titles[url]
+
+    def get_remote_urls(self, metadata, pages, files):
+        """
+        Find the urls of pages and files in notebook metadata that need details from the web.
+
+        Parameters:
+            metadata: notebook (or page) metadata
+            pages: a set to add page urls to
+            files: a set to add file urls to
+        """
+        for key, value in metadata.items():
+            if key == "action":
+                for action in listify(value):
+                    for file_relation in ["result", "object"]:
+                        for data_file in self.filter_files(action, file_relation):
+                            if data_file.get("url") and not data_file.get("localPath"):
+                                files.add(data_file["url"])
+            elif key in CONTEXT_PROPERTIES and key not in ["license", "distribution"]:
+                for page in listify(value):
+                    if isinstance(page, str):
+                        pages.add(page)
+                    elif isinstance(page, dict):
+                        if page.get("url") and not page.get("name"):
+                            pages.add(page["url"])
+                        # Authors and pages can have pages of their own
+                        self.get_remote_urls(page, pages, files)
+
+    def resolve_remote(self, notebooks):
+        """
+        Fetch all the remote details the crate needs (GitHub repositories, file stats,
+        and page titles) at the same time, before the crate is built.
+        """
+        pages = set()
+        files = set()
+        for notebook in notebooks:
+            self.get_remote_urls(self.get_nb_metadata(notebook), pages, files)
+        _, repo_url = self.get_repo_info()
+        # Only fetch each repository once
+        repos = {
+            self.get_gh_parts(url): url
+            for url in [repo_url] + [f for f in files if "github" in f]
+        }
+        with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+            # Get repositories first, as they're needed for the stats of files on GitHub
+            list(executor.map(self.get_gh_repo, repos.values()))
+            list(executor.map(self.get_web_file_stats, files))
+            list(executor.map(self.get_page_title, pages))
 
     def get_nb_metadata(self, notebook):
-        nb = nbformat.read(notebook, nbformat.NO_CONVERT)
-        return {k: v for k, v in nb.metadata.rocrate.items() if v}
+        metadata = self.notebook_index.get_metadata(notebook)
+        # Return a copy, as the metadata is modified while the crate is built
+        return copy.deepcopy({k: v for k, v in metadata.items() if v})
 
     def add_notebook(self, notebook):
         gh_url = self.get_gh_file_url(notebook)
@@ -571,6 +928,11 @@ class CrateMaker:
             root_props, crate_source, entities, versions = self.prepare_data_crate()
         else:
             root_props, crate_source, entities, versions = self.prepare_code_crate()
+        # Reuse values derived from files that haven't changed since the last update
+        fingerprints_path = Path(crate_source, FINGERPRINTS_FILE)
+        if self.full:
+            fingerprints_path.unlink(missing_ok=True)
+        self.fingerprints = Fingerprints(fingerprints_path)
         self.crate = ROCrate()
         # Add properties to the root
         root = self.crate.get("./")
@@ -590,8 +952,10 @@ class CrateMaker:
         if self.version:
             root["version"] = self.version
             self.add_update_action(self.version)
+        notebooks = self.get_notebooks()
+        self.resolve_remote(notebooks)
         # Add notebooks
-        for notebook in self.get_notebooks():
+        for notebook in notebooks:
             nb = self.add_notebook(notebook)
             for author in listify(nb.get("author")):
                 if author not in root.get("author", []):
@@ -600,6 +964,8 @@ class CrateMaker:
         root["license"] = self.add_context_entity(LICENCES["metadata"])
         # Save crate
         self.crate.write(crate_source)
+        self.fingerprints.save()
+        self.notebook_index.save()
 
 
 if __name__ == "__main__":
@@ -617,10 +983,13 @@ if __name__ == "__main__":
         "--version", type=str, help="New version number", required=False
     )
     parser.add_argument("--data-repo", type=str, default="", required=False)
+    parser.add_argument(
+        "--full", action="store_true", help="Ignore saved fingerprints and process every file"
+    )
     args = parser.parse_args()
     if args.defaults:
         defaults = json.loads(Path(args.defaults).read_text())
     else:
         defaults = {}
 
-    main(defaults=defaults, crate_path=args.crate_path, version=args.version, data_repo=args.data_repo)
+    main(defaults=defaults, crate_path=args.crate_path, version=args.version, data_repo=args.data_repo, full=args.full)
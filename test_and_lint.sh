@@ -1,17 +1,88 @@
 #!/bin/bash
-pytest --nbval-lax $1
-if nbqa isort $1; then
+# Test and lint notebooks, eg: ./test_and_lint.sh mynotebook.ipynb
+#
+# Notebooks are tested in parallel if pytest-xdist is installed (set WORKERS to change the number).
+# If there are recorded SPARQL responses in $SPARQL_FIXTURES, they're used instead of the live
+# Wikidata Query Service. Set SPARQL_MODE to 'record' to save new responses, or 'live' to ignore them.
+# Set SPARQL_MODE to 'local' to run queries against a local extract of Wikidata in $SPARQL_SUBSET
+# (see wikidata_tools/local.py). Except in 'live' mode, notebooks use a temporary agency store.
+# Notebooks that haven't changed since they last passed the lint checks aren't checked again.
+# Unit tests of the wikidata_tools package and scripts (in tests/) are run first.
+SPARQL_FIXTURES=${SPARQL_FIXTURES:-fixtures/sparql}
+SPARQL_SUBSET=${SPARQL_SUBSET:-wikidata-subset.nt.gz}
+SPARQL_MODE=${SPARQL_MODE:-$([ -d "$SPARQL_FIXTURES" ] && echo replay || echo live)}
+LINT_CACHE=${LINT_CACHE:-.lint-cache}
+
+# Run the unit tests before the SPARQL settings below are changed
+pytest -q tests || exit 1
+
+case $SPARQL_MODE in
+    replay)
+        export GW_SPARQL_CACHE_DIR=$SPARQL_FIXTURES GW_SPARQL_CACHE_ONLY=true
+        ;;
+    record)
+        export GW_SPARQL_CACHE_DIR=$SPARQL_FIXTURES GW_SPARQL_CACHE_TTL=0 GW_SPARQL_CACHE_MAX_SIZE=0
+        ;;
+    local)
+        export GW_SPARQL_ENDPOINT=file:$SPARQL_SUBSET
+        ;;
+esac
+if [ "$SPARQL_MODE" != live ]; then
+    # The queries sent by the agency store depend on what's already in it, so record,
+    # replay and local runs start with an empty store (shared by the parallel workers)
+    agency_store_dir=$(mktemp -d)
+    trap 'rm -rf "$agency_store_dir"' EXIT
+    export GW_AGENCY_STORE=$agency_store_dir/agency_store.sqlite
+fi
+echo "SPARQL:   $SPARQL_MODE"
+
+if python -c "import xdist" 2> /dev/null; then
+    # Keep all the cells of a notebook together in the same worker
+    pytest --nbval-lax --ignore=tests -n ${WORKERS:-auto} --dist loadfile $1
+else
+    pytest --nbval-lax --ignore=tests $1
+fi
+
+# Lint results depend on the tool versions and settings, as well as the notebook
+lint_config=$( (nbqa --version; isort --version-number; black --version; flake8 --version; cat pyproject.toml) 2> /dev/null | sha256sum | cut -d " " -f 1)
+notebook_hash() {
+    (echo $lint_config; cat "$1") | sha256sum | cut -d " " -f 1
+}
+notebooks=()
+while IFS= read -r nb; do
+    if ! grep -qxF "$(notebook_hash "$nb") $nb" "$LINT_CACHE" 2> /dev/null; then
+        notebooks+=("$nb")
+    fi
+done < <(find ${1:-.} -maxdepth 1 -name "*.ipynb" | sort)
+
+if [ ${#notebooks[@]} -eq 0 ]; then
+    echo "Lint:     $(tput setab 2)$(tput setaf 7)UNCHANGED$(tput sgr0)"
+    exit
+fi
+passed=true
+if nbqa isort "${notebooks[@]}"; then
     echo "ISort:    $(tput setab 2)$(tput setaf 7)PASSED$(tput sgr0)"
 else
     echo "ISort:    $(tput setab 1)$(tput setaf 7)FAILED$(tput sgr0)"
+    passed=false
 fi
-if nbqa black $1; then
+if nbqa black "${notebooks[@]}"; then
     echo "Black:    $(tput setab 2)$(tput setaf 7)PASSED$(tput sgr0)"
 else
     echo "Black:    $(tput setab 1)$(tput setaf 7)FAILED$(tput sgr0)"
+    passed=false
 fi
-if nbqa flake8 $1; then
+if nbqa flake8 "${notebooks[@]}"; then
     echo "Flake8:   $(tput setab 2)$(tput setaf 7)PASSED$(tput sgr0)"
 else
     echo "Flake8:   $(tput setab 1)$(tput setaf 7)FAILED$(tput sgr0)"
+    passed=false
+fi
+if $passed; then
+    # Record the notebooks (as formatted by isort and black) that passed
+    for nb in "${notebooks[@]}"; do
+        awk -v nb="$nb" 'substr($0, 66) != nb' "$LINT_CACHE" > "$LINT_CACHE.tmp" 2> /dev/null
+        echo "$(notebook_hash "$nb") $nb" >> "$LINT_CACHE.tmp"
+        mv "$LINT_CACHE.tmp" "$LINT_CACHE"
+    done
 fi
@@ -0,0 +1,35 @@
+import pandas as pd
+
+from wikidata_tools.agencies import add_node_properties
+
+
+def test_node_properties():
+    df = pd.DataFrame(
+        {
+            "agency": ["Q1", "Q2", "Q3"],
+            "start_date": ["1901-01-01T00:00:00Z", "1975-06-01T00:00:00Z", None],
+            "end_date": ["1916-01-01T00:00:00Z", None, None],
+        }
+    )
+    df = add_node_properties(df)
+    assert list(df["level"][:2]) == [1901, 1975]
+    assert list(df["group"][:2]) == ["190", "197"]
+    # Current agencies are bigger than ones that only lasted a few years
+    assert df["size"][1] > df["size"][0]
+
+
+def test_node_properties_unknown_start():
+    df = pd.DataFrame(
+        {
+            "agency": ["Q1", "Q2"],
+            "start_date": ["1901-01-01T00:00:00Z", "_:unknown"],
+        }
+    )
+    df = add_node_properties(df)
+    # Levels and groups of agencies with known dates aren't turned into floats
+    assert df["level"].dtype == "Int64"
+    assert df["level"][0] == 1901
+    assert df["group"][0] == "190"
+    assert df["level"].isna()[1]
+    assert df["group"].isna()[1]
+    assert pd.isna(df["size"][1])
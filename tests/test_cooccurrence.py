@@ -0,0 +1,56 @@
+import pandas as pd
+
+from wikidata_tools.cooccurrence import cooccurrence_links, cooccurrence_matrix
+
+MEMBERSHIPS = pd.DataFrame(
+    [
+        ("Q1", "P1"),
+        ("Q1", "P2"),
+        ("Q1", "P2"),
+        ("Q2", "P1"),
+        ("Q2", "P3"),
+        ("Q3", "P2"),
+    ],
+    columns=["item", "property"],
+)
+
+PROPERTIES = pd.DataFrame(
+    {"property": ["P2", "P1", "P3"], "propertyLabel": ["Two", "One", "Three"]}
+)
+
+
+def as_dict(matrix, index):
+    return {
+        (index[r], index[c]): v for r, c, v in zip(matrix.row, matrix.col, matrix.data)
+    }
+
+
+def test_matrix():
+    counts = as_dict(*cooccurrence_matrix(MEMBERSHIPS))
+    # Repeated values are counted every time
+    assert counts[("P1", "P2")] == counts[("P2", "P1")] == 2
+    assert counts[("P2", "P2")] == 5
+    assert counts[("P1", "P3")] == 1
+    assert ("P2", "P3") not in counts
+
+
+def test_matrix_unweighted():
+    counts = as_dict(*cooccurrence_matrix(MEMBERSHIPS, weighted=False))
+    assert counts[("P1", "P2")] == 1
+    assert counts[("P2", "P2")] == 2
+
+
+def test_matrix_from_chunks():
+    chunks = [MEMBERSHIPS.iloc[:2], MEMBERSHIPS.iloc[2:4], MEMBERSHIPS.iloc[4:]]
+    assert as_dict(*cooccurrence_matrix(chunks)) == as_dict(
+        *cooccurrence_matrix(MEMBERSHIPS)
+    )
+
+
+def test_links():
+    df = cooccurrence_links(MEMBERSHIPS, PROPERTIES)
+    assert list(df.columns) == ["target_prop", "count", "source", "source_prop"]
+    # Ordered by source property (as in the list of properties), then by count
+    assert list(df["source_prop"]) == ["P2", "P2", "P1", "P1", "P1", "P3", "P3"]
+    assert list(df["target_prop"][:2]) == ["P2", "P1"]
+    assert list(df["source"].unique()) == ["Two", "One", "Three"]
@@ -0,0 +1,67 @@
+import pandas as pd
+import pytest
+
+from wikidata_tools import datasets
+from wikidata_tools.datasets import LINKS_SCHEMA, load_dataset, save_dataset
+
+LINKS = pd.DataFrame(
+    {
+        "source_prop": ["P1", "P1", "P2", "P3"],
+        "source": ["One", "One", "Two", "Three"],
+        "topic_source": ["arts", "arts", "science", "arts"],
+        "target_prop": ["P1", "P2", "P3", "P1"],
+        "source_target": ["One", "Two", "Three", "One"],
+        "topic_target": ["arts", "science", "arts", "arts"],
+        "count": [50, 30, 10, 25],
+        "extra": ["not", "saved", "at", "all"],
+    }
+)
+
+
+@pytest.fixture
+def links_path(tmp_path):
+    return save_dataset(LINKS, tmp_path / "links.parquet", LINKS_SCHEMA)
+
+
+def test_save_and_load(links_path):
+    df = load_dataset(links_path)
+    assert list(df.columns) == LINKS_SCHEMA.names
+    assert df["count"].dtype == "int64"
+    assert isinstance(df["source"].dtype, pd.CategoricalDtype)
+    pd.testing.assert_frame_equal(
+        df.astype({c: str for c in df.columns if c != "count"}),
+        LINKS[LINKS_SCHEMA.names],
+    )
+
+
+def test_load_with_filters(links_path):
+    df = load_dataset(
+        links_path,
+        columns=["source_prop", "target_prop", "count"],
+        filters=[("topic_source", "==", "arts"), ("count", ">", 20)],
+    )
+    assert list(df.columns) == ["source_prop", "target_prop", "count"]
+    assert df["count"].tolist() == [50, 30, 25]
+
+
+def test_shared_categories(links_path):
+    df = load_dataset(links_path)
+    # Columns that are compared with each other have the same categories
+    assert (df["source_prop"] == df["target_prop"]).tolist() == [
+        True,
+        False,
+        False,
+        False,
+    ]
+    assert list(df["source"].cat.categories) == ["One", "Three", "Two"]
+    assert list(df["source_target"].cat.categories) == ["One", "Three", "Two"]
+    # Other columns only have their own values
+    assert list(df["topic_source"].cat.categories) == ["arts", "science"]
+    assert df["topic_source"].value_counts().to_dict() == {"arts": 3, "science": 1}
+
+
+def test_export_csv(links_path):
+    csv_path = datasets.export_csv(links_path)
+    assert csv_path.suffix == ".csv"
+    df = pd.read_csv(csv_path)
+    assert df["source"].tolist() == LINKS["source"].tolist()
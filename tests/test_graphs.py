@@ -0,0 +1,65 @@
+import pandas as pd
+
+from wikidata_tools import graphs
+from wikidata_tools.graphs import build_network, get_graph_data
+
+COLOUR = graphs.DEFAULT_NODE_COLOUR
+
+NODES = pd.DataFrame(
+    {
+        "id": ["A", "B", "C", "A"],
+        "label": ["Agency A", "", None, "Duplicate"],
+        "size": [10.0, float("nan"), 30.0, 40.0],
+    }
+)
+
+EDGES = pd.DataFrame(
+    {
+        "from": ["A", "B", "A", "C"],
+        "to": ["B", "A", "X", "A"],
+    }
+)
+
+
+def test_nodes():
+    nodes, _ = get_graph_data(NODES, EDGES)
+    # The first node with each id is kept, and labels default to the id
+    assert nodes == [
+        {
+            "id": "A",
+            "label": "Agency A",
+            "size": 10.0,
+            "shape": "dot",
+            "color": COLOUR,
+        },
+        {"id": "B", "label": "B", "shape": "dot", "color": COLOUR},
+        {
+            "id": "C",
+            "label": "C",
+            "size": 30.0,
+            "shape": "dot",
+            "color": COLOUR,
+        },
+    ]
+
+
+def test_undirected_edges():
+    _, edges = get_graph_data(NODES, EDGES)
+    # Edges to missing nodes and reversed duplicates are dropped
+    assert edges == [{"from": "A", "to": "B"}, {"from": "C", "to": "A"}]
+
+
+def test_directed_edges():
+    _, edges = get_graph_data(NODES, EDGES, directed=True)
+    assert edges == [
+        {"from": "A", "to": "B", "arrows": "to"},
+        {"from": "B", "to": "A", "arrows": "to"},
+        {"from": "C", "to": "A", "arrows": "to"},
+    ]
+
+
+def test_build_network():
+    net = build_network(NODES, EDGES, directed=True)
+    assert net.get_nodes() == ["A", "B", "C"]
+    assert len(net.get_edges()) == 3
+    assert net.node_map["A"]["label"] == "Agency A"
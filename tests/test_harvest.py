@@ -0,0 +1,46 @@
+import time
+
+import pandas as pd
+import pytest
+
+from wikidata_tools.harvest import Harvester
+
+
+@pytest.fixture
+def harvester(tmp_path, monkeypatch):
+    harvester = Harvester(
+        checkpoint=tmp_path / "harvest-checkpoint.ndjson", max_workers=1
+    )
+    harvester.sent = []
+
+    def run_query(query):
+        harvester.sent.append(query)
+        if query == "fail":
+            raise ValueError(query)
+        time.sleep(0.05)
+        return pd.DataFrame({"query": [query]}), 0
+
+    monkeypatch.setattr(harvester, "run_query", run_query)
+    return harvester
+
+
+def test_harvest(harvester):
+    results = harvester.harvest({"a": "query a", "b": "query b"})
+    assert list(results) == ["a", "b"]
+    assert results["b"]["query"].tolist() == ["query b"]
+    # The checkpoint is removed once the harvest is complete
+    assert not harvester.checkpoint.exists()
+
+
+def test_failed_harvest_resumes(harvester):
+    queries = {"a": "query a", "b": "fail", "c": "query c", "d": "query d"}
+    with pytest.raises(ValueError):
+        harvester.harvest(queries)
+    # Queries still waiting when the error was raised aren't sent
+    assert harvester.sent == ["query a", "fail", "query c"]
+    assert set(harvester.load_checkpoint()) == {"a", "c"}
+    harvester.sent.clear()
+    queries["b"] = "query b"
+    results = harvester.harvest(queries)
+    assert harvester.sent == ["query b", "query d"]
+    assert [df["query"][0] for df in results.values()] == list(queries.values())
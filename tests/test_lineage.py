@@ -0,0 +1,97 @@
+import re
+
+import pandas as pd
+import pytest
+
+from wikidata_tools import lineage
+from wikidata_tools.lineage import ENTITY_PREFIX, PROP_PREFIX, LineageIndex
+
+
+class FakeWikidata:
+    """
+    Answers the lineage queries from lists of agencies and statements.
+    """
+
+    def __init__(self):
+        self.agencies = {}
+        self.statements = []
+
+    def add(self, agency, modified, after=None):
+        self.agencies[agency] = pd.Timestamp(modified, tz="UTC")
+        self.statements = [s for s in self.statements if s[0] != agency]
+        if after:
+            self.statements.append((agency, "P1366", after))
+        self.statements += [
+            (agency, "P1365", a)
+            for a, prop, other in self.statements
+            if prop == "P1366" and other == agency
+        ]
+
+    def get_dataframe(self, query, endpoint=None, **kwargs):
+        since = re.search(r'FILTER \(\?modified > "([^"]+)"', query)
+        since = pd.Timestamp(since.group(1)) if since else None
+        agencies = [a for a, m in self.agencies.items() if since is None or m > since]
+        if "?label" in query:
+            df = pd.DataFrame(
+                {
+                    "agency": [ENTITY_PREFIX + a for a in agencies],
+                    "label": [f"Agency {a}" for a in agencies],
+                    "id": [f"CA {a[1:]}" for a in agencies],
+                    "start_date": "1901-01-01T00:00:00Z",
+                    "end_date": None,
+                    "modified": [self.agencies[a].isoformat() for a in agencies],
+                }
+            )
+        else:
+            rows = [s for s in self.statements if s[0] in agencies]
+            df = pd.DataFrame(
+                {
+                    "agency": [ENTITY_PREFIX + a for a, _, _ in rows],
+                    "property": [PROP_PREFIX + p for _, p, _ in rows],
+                    "other": [ENTITY_PREFIX + o for _, _, o in rows],
+                },
+                dtype="object",
+            )
+        return df
+
+
+@pytest.fixture
+def wikidata(monkeypatch):
+    fake = FakeWikidata()
+    # A chain of agencies, Q1 replaced by Q2, replaced by Q3 and so on
+    for n in range(1, 6):
+        fake.add(f"Q{n}", "2020-01-01", after=f"Q{n + 1}" if n < 5 else None)
+    monkeypatch.setattr(lineage, "get_dataframe", fake.get_dataframe)
+    return fake
+
+
+def test_search_depth(wikidata):
+    index = LineageIndex().load()
+    assert index.get_connected("Q3", 0) == {"Q3"}
+    assert index.get_connected("Q3", 1) == {"Q2", "Q3", "Q4"}
+    assert index.get_connected("Q1", 2) == {"Q1", "Q2", "Q3"}
+    assert index.get_connected("Q1", 10) == {"Q1", "Q2", "Q3", "Q4", "Q5"}
+    assert index.get_connected("Q99", 2) == {"Q99"}
+
+
+def test_get_lineage(wikidata):
+    index = LineageIndex().load()
+    df = index.get_lineage("Q1", 1)
+    assert list(df.columns) == lineage.LINEAGE_COLUMNS
+    assert df["agency"].tolist() == [ENTITY_PREFIX + "Q1", ENTITY_PREFIX + "Q2"]
+    # Successors are included even if they're outside the search
+    assert df["after_id"].tolist() == ["CA 2", "CA 3"]
+    assert index.get_lineage("Q99", 1).empty
+
+
+def test_refresh(wikidata):
+    index = LineageIndex().load()
+    # Q3 is now replaced by a new agency, instead of Q4
+    wikidata.add("Q6", "2021-01-01")
+    wikidata.add("Q3", "2021-01-01", after="Q6")
+    index.refresh()
+    assert index.last_modified == pd.Timestamp("2021-01-01", tz="UTC")
+    assert index.get_connected("Q3", 1) == {"Q2", "Q3", "Q6"}
+    df = index.get_lineage("Q3", 0)
+    assert df["after"].tolist() == [ENTITY_PREFIX + "Q6"]
+    assert sorted(index.nodes["agency"]) == ["Q1", "Q2", "Q3", "Q4", "Q5", "Q6"]
@@ -0,0 +1,107 @@
+import threading
+import time
+
+import pytest
+
+from wikidata_tools import prefetch
+from wikidata_tools.prefetch import PrefetchCache
+
+
+class Renderer:
+    def __init__(self):
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def __call__(self, agency, levels):
+        with self.lock:
+            self.calls.append((agency, levels))
+        return f"{agency}-{levels}"
+
+
+def test_get_renders_once():
+    render = Renderer()
+    cache = PrefetchCache(render, maxsize=2)
+    assert cache.get(("Q1", 2)) == "Q1-2"
+    assert cache.get(("Q1", 2)) == "Q1-2"
+    assert render.calls == [("Q1", 2)]
+
+
+def test_least_recently_used_are_removed():
+    render = Renderer()
+    cache = PrefetchCache(render, maxsize=2)
+    cache.get(("Q1", 2))
+    cache.get(("Q2", 2))
+    cache.get(("Q1", 2))
+    cache.get(("Q3", 2))
+    assert len(cache) == 2
+    assert ("Q1", 2) in cache
+    assert ("Q2", 2) not in cache
+
+
+def test_errors_are_not_cached():
+    def render(agency, levels):
+        raise ValueError(agency)
+
+    cache = PrefetchCache(render)
+    with pytest.raises(ValueError):
+        cache.get(("Q1", 2))
+    assert ("Q1", 2) not in cache
+    with pytest.raises(ValueError):
+        cache.get(("Q1", 2))
+
+
+def wait_until(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+def test_prefetch():
+    render = Renderer()
+    cache = PrefetchCache(render, maxsize=5)
+    cache.prefetch([("Q1", 2), ("Q2", 2)])
+    wait_until(lambda: len(cache) == 2)
+    assert cache.get(("Q2", 2)) == "Q2-2"
+    assert render.calls == [("Q1", 2), ("Q2", 2)]
+
+
+def test_background_prefetch_stops_when_full():
+    render = Renderer()
+    cache = PrefetchCache(render, maxsize=2)
+    cache.prefetch([(f"Q{n}", 2) for n in range(5)], background=True)
+    wait_until(lambda: len(cache) == 2)
+    # Give the worker a chance to (wrongly) render any more
+    time.sleep(0.1)
+    assert render.calls == [("Q0", 2), ("Q1", 2)]
+
+
+class SlowEvent(threading.Event):
+    """
+    An event that pauses the thread that sets it, so waiting threads run first.
+    """
+
+    def set(self):
+        super().set()
+        time.sleep(0.02)
+
+
+def test_waiting_callers_use_the_result(monkeypatch):
+    monkeypatch.setattr(prefetch.threading, "Event", SlowEvent)
+    render = Renderer()
+    release = threading.Event()
+
+    def slow_render(agency, levels):
+        release.wait()
+        return render(agency, levels)
+
+    cache = PrefetchCache(slow_render)
+    threads = [threading.Thread(target=cache.get, args=(("Q1", 2),)) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    # Let the other callers start waiting for the first one to finish rendering
+    time.sleep(0.02)
+    release.set()
+    for thread in threads:
+        thread.join()
+    assert render.calls == [("Q1", 2)]
@@ -0,0 +1,96 @@
+import pandas as pd
+
+from wikidata_tools.results import XSD, parse_results
+
+
+def literal(value, datatype=None, lang=None):
+    binding = {"type": "literal", "value": value}
+    if datatype:
+        binding["datatype"] = f"{XSD}{datatype}"
+    if lang:
+        binding["xml:lang"] = lang
+    return binding
+
+
+def uri(value):
+    return {"type": "uri", "value": f"http://www.wikidata.org/entity/{value}"}
+
+
+RESULTS = {
+    "head": {"vars": ["item", "label", "date", "count", "mixed", "flag", "missing"]},
+    "results": {
+        "bindings": [
+            {
+                "item": uri("Q1"),
+                "label": literal("One", lang="en"),
+                "date": literal("1901-01-01T00:00:00Z", "dateTime"),
+                "count": literal("5", "integer"),
+                "mixed": literal("5", "integer"),
+                "flag": literal("true", "boolean"),
+            },
+            {
+                "item": uri("Q1"),
+                "label": literal("Un", lang="fr"),
+                # An 'unknown value' is returned as a blank node
+                "date": {"type": "bnode", "value": "t1"},
+                "count": literal("7", "integer"),
+                "mixed": literal("2.5", "decimal"),
+                "flag": literal("0", "boolean"),
+            },
+            {
+                "item": uri("Q2"),
+                "date": literal("0900-01-01T00:00:00Z", "dateTime"),
+                "mixed": literal("3", "double"),
+                "flag": literal("false", "boolean"),
+            },
+        ]
+    },
+}
+
+
+def test_typed_columns():
+    df = parse_results(RESULTS)
+    assert list(df.columns) == RESULTS["head"]["vars"]
+    assert str(df["date"].dtype) == "datetime64[ns, UTC]"
+    assert df["date"][0] == pd.Timestamp("1901-01-01", tz="UTC")
+    # Blank nodes and dates outside the range pandas supports become NaT
+    assert df["date"][1:].isna().all()
+    # Integer columns with missing values use the nullable integer type
+    assert df["count"].dtype == "Int64"
+    assert df["count"][:2].tolist() == [5, 7]
+    assert pd.isna(df["count"][2])
+    assert df["mixed"].tolist() == [5.0, 2.5, 3.0]
+    assert df["flag"].tolist() == [True, False, False]
+    assert df["label"].tolist() == ["One", "Un", None]
+    assert df["missing"].isna().all()
+
+
+def test_categories():
+    df = parse_results(RESULTS)
+    # Urls are only stored as categories if they're repeated
+    assert df["item"].dtype == "object"
+    results = {
+        "head": RESULTS["head"],
+        "results": {"bindings": RESULTS["results"]["bindings"] * 2},
+    }
+    df = parse_results(results)
+    assert isinstance(df["item"].dtype, pd.CategoricalDtype)
+
+
+def test_untyped_with_details():
+    df = parse_results(RESULTS, typed=False, details=True)
+    assert df["count"].tolist() == ["5", "7", None]
+    assert df["date_type"].tolist() == ["literal", "bnode", "literal"]
+    assert df["label_lang"][:2].tolist() == ["en", "fr"]
+    assert pd.isna(df["label_lang"][2])
+
+
+def test_parse_bytes():
+    results = (
+        b'{"head": {"vars": ["n"]}, "results": {"bindings": '
+        b'[{"n": {"type": "literal", "value": "1", '
+        b'"datatype": "http://www.w3.org/2001/XMLSchema#integer"}}]}}'
+    )
+    df = parse_results(results)
+    assert df["n"].dtype == "int64"
+    assert df["n"].tolist() == [1]
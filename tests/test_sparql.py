@@ -0,0 +1,85 @@
+import os
+import time
+
+import pytest
+
+from wikidata_tools import sparql
+from wikidata_tools.sparql import CacheMiss, SparqlCache, get_response
+
+QUERY = "SELECT ?item WHERE { ?item wdt:P10856 [] }"
+
+
+def age(path, seconds):
+    """
+    Make a cache entry look like it was fetched (and last read) some time ago.
+    """
+    then = time.time() - seconds
+    os.utime(path, (then, then))
+
+
+def test_cache_expires_entries(tmp_path):
+    cache = SparqlCache(tmp_path, ttl=60)
+    cache.set("key", b"data")
+    assert cache.get("key") == b"data"
+    age(cache.path("key"), 120)
+    assert cache.get("key") is None
+    assert cache.get("key", ttl=300) == b"data"
+    assert cache.get("key", allow_stale=True) == b"data"
+
+
+def test_cache_removes_least_recently_used(tmp_path):
+    cache = SparqlCache(tmp_path, ttl=None, max_size=10)
+    cache.set("a", b"aaaa")
+    cache.set("b", b"bbbb")
+    age(cache.path("a"), 30)
+    age(cache.path("b"), 20)
+    # Reading an entry makes it the most recently used, without changing its fetch time
+    assert cache.get("a") == b"aaaa"
+    cache.set("c", b"cccc")
+    assert sorted(p.stem for p in tmp_path.glob("*.json")) == ["a", "c"]
+    assert time.time() - cache.path("a").stat().st_mtime > 25
+
+
+def test_cache_without_size_limit(tmp_path):
+    cache = SparqlCache(tmp_path, ttl=None, max_size=0)
+    for key in "abc":
+        cache.set(key, b"data")
+    assert len(list(tmp_path.glob("*.json"))) == 3
+
+
+@pytest.fixture
+def responses(tmp_path, monkeypatch):
+    """
+    Use an empty cache, and record the queries sent to the endpoint.
+    """
+    monkeypatch.setattr(sparql, "_cache", SparqlCache(tmp_path, ttl=60))
+    # Ignore GW_SPARQL_CACHE_ONLY (eg when the notebooks are tested with recorded responses)
+    monkeypatch.setattr(sparql, "CACHE_ONLY", False)
+    sent = []
+
+    def fetch_response(query, endpoint=sparql.WIKIDATA_ENDPOINT):
+        sent.append(query)
+        return b'{"head": {"vars": []}, "results": {"bindings": []}}'
+
+    monkeypatch.setattr(sparql, "fetch_response", fetch_response)
+    return sent
+
+
+def test_get_response_uses_cache(responses):
+    first = get_response(QUERY)
+    # Differences in whitespace don't change the cache key
+    assert get_response(f"  {QUERY}\n") == first
+    assert len(responses) == 1
+    get_response(QUERY, use_cache=False)
+    assert len(responses) == 2
+
+
+def test_get_response_cache_only(responses):
+    with pytest.raises(CacheMiss):
+        get_response(QUERY, cache_only=True)
+    assert responses == []
+    data = get_response(QUERY)
+    # Expired responses are still used in cache-only mode
+    age(sparql.get_cache().path(sparql.cache_key(QUERY)), 120)
+    assert get_response(QUERY, cache_only=True) == data
+    assert len(responses) == 1
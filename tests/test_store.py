@@ -0,0 +1,117 @@
+import re
+
+import pandas as pd
+import pytest
+
+from wikidata_tools import store
+from wikidata_tools.lineage import ENTITY_PREFIX, PROP_PREFIX
+from wikidata_tools.store import AgencyStore
+
+
+def selected_agencies(query):
+    """
+    Get the agencies in the VALUES clause of a query, or None if there isn't one.
+    """
+    if match := re.search(r"VALUES \?agency \{([^}]*)\}", query):
+        return re.findall(r"wd:(Q\d+)", match.group(1))
+
+
+class FakeWikidata:
+    """
+    Answers the store's queries from a dict of agencies, recording the queries.
+    """
+
+    def __init__(self):
+        self.agencies = {}
+        self.queries = []
+
+    def add(
+        self, agency, name, modified, start_date="1901-01-01T00:00:00Z", after=None
+    ):
+        self.agencies[agency] = {
+            "id": f"CA {agency[1:]}",
+            "name": name,
+            "modified": modified,
+            "start_date": start_date,
+            "after": after,
+        }
+
+    def get_dataframe(self, query, endpoint=None, **kwargs):
+        self.queries.append(query)
+        selected = selected_agencies(query)
+        agencies = {
+            a: v for a, v in self.agencies.items() if selected is None or a in selected
+        }
+        if query == store.ITEMS_QUERY:
+            rows = [(a, v["id"], v["modified"]) for a, v in agencies.items()]
+            columns = ["agency", "id", "modified"]
+        elif "?start_date" in query:
+            rows = [
+                (a, v["name"], v["start_date"], None, "true", "true")
+                for a, v in agencies.items()
+            ]
+            columns = ["agency", "name", "start_date", "end_date", "direct", "subclass"]
+        else:
+            rows = [
+                (a, f"{PROP_PREFIX}P1366", f"{ENTITY_PREFIX}{v['after']}")
+                for a, v in agencies.items()
+                if v["after"]
+            ]
+            columns = ["agency", "property", "other"]
+        df = pd.DataFrame(rows, columns=columns, dtype="object")
+        df["agency"] = ENTITY_PREFIX + df["agency"]
+        return df
+
+
+@pytest.fixture
+def wikidata(monkeypatch):
+    fake = FakeWikidata()
+    monkeypatch.setattr(store, "get_dataframe", fake.get_dataframe)
+    return fake
+
+
+@pytest.fixture
+def agency_store(tmp_path, wikidata):
+    wikidata.add("Q1", "Dept A", "2020-01-01T00:00:00Z", after="Q2")
+    wikidata.add(
+        "Q2", "Dept B", "2020-01-01T00:00:00Z", start_date="1916-01-01T00:00:00Z"
+    )
+    wikidata.add("Q3", "Dept C", "2020-01-01T00:00:00Z")
+    for n in range(5, 8):
+        wikidata.add(f"Q{n}", f"Dept {n}", "2020-01-01T00:00:00Z")
+    return AgencyStore(tmp_path / "agencies.sqlite", endpoint="test").refresh()
+
+
+def test_first_refresh_gets_everything(agency_store, wikidata):
+    assert agency_store.changes == {"added": 6, "updated": 0, "removed": 0}
+    # Details of all the items are requested at once
+    assert all(selected_agencies(q) is None for q in wikidata.queries)
+    df = agency_store.get_agencies()
+    assert sorted(df["agency"]) == ["Q1", "Q2", "Q3", "Q5", "Q6", "Q7"]
+    assert df.set_index("agency").loc["Q2", "label"] == "Dept B (1916-)"
+    assert agency_store.get_edges().values.tolist() == [["Q1", "P1366", "Q2"]]
+
+
+def test_refresh_without_changes(agency_store, wikidata):
+    wikidata.queries.clear()
+    agency_store.refresh()
+    assert agency_store.changes == {"added": 0, "updated": 0, "removed": 0}
+    assert wikidata.queries == [store.ITEMS_QUERY]
+
+
+def test_refresh_changes(agency_store, wikidata):
+    wikidata.add("Q2", "Dept B renamed", "2021-01-01T00:00:00Z")
+    wikidata.add("Q4", "Dept D", "2021-01-01T00:00:00Z")
+    del wikidata.agencies["Q1"]
+    wikidata.queries.clear()
+    agency_store.refresh()
+    assert agency_store.changes == {"added": 1, "updated": 1, "removed": 1}
+    # Only the changed items are requested, as there are only a few of them
+    details = [q for q in wikidata.queries if "?start_date" in q]
+    assert len(details) == 1
+    assert selected_agencies(details[0]) == ["Q2", "Q4"]
+    df = agency_store.get_agencies().set_index("agency")
+    assert sorted(df.index) == ["Q2", "Q3", "Q4", "Q5", "Q6", "Q7"]
+    assert df.loc["Q2", "name"] == "Dept B renamed"
+    # Statements of removed items are removed too
+    assert agency_store.get_edges().empty
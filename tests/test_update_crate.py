@@ -0,0 +1,72 @@
+import csv
+import importlib
+import sys
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "scripts"))
+
+
+@pytest.fixture
+def update_crate(monkeypatch):
+    # The script loads its settings from paths relative to the root of the repository
+    monkeypatch.chdir(ROOT)
+    return importlib.import_module("update_crate")
+
+
+ROWS = [
+    ["id", "title", "notes"],
+    ["1", "plain", ""],
+    ["2", "line\nbreaks", 'a "quoted" word'],
+    ["3", '"', "trailing,comma,"],
+    ["4", 'ends with quote"', "\n\n"],
+]
+
+
+def write_csv(path, rows, lineterminator="\n"):
+    with path.open("w", newline="") as csv_file:
+        csv.writer(csv_file, lineterminator=lineterminator).writerows(rows)
+    return path
+
+
+@pytest.mark.parametrize("lineterminator", ["\n", "\r\n"])
+@pytest.mark.parametrize("chunk_size", [1, 3, 1024])
+def test_count_quoted_values(
+    update_crate, tmp_path, monkeypatch, lineterminator, chunk_size
+):
+    monkeypatch.setattr(update_crate, "COUNT_CHUNK_SIZE", chunk_size)
+    path = write_csv(tmp_path / "data.csv", ROWS, lineterminator)
+    assert update_crate.count_records(path) == len(ROWS)
+
+
+def test_count_in_parallel(update_crate, tmp_path, monkeypatch):
+    monkeypatch.setattr(update_crate, "COUNT_CHUNK_SIZE", 5)
+    monkeypatch.setattr(update_crate.os, "cpu_count", lambda: 3)
+    path = write_csv(tmp_path / "data.csv", ROWS * 10)
+    assert update_crate.count_records(path, parallel_size=1) == len(ROWS) * 10
+
+
+def test_count_stray_quotes(update_crate, tmp_path):
+    path = tmp_path / "data.csv"
+    path.write_text('id,description\n1,5" screen\n2,plain\n3,other\n')
+    assert update_crate.count_records(path) == 4
+    # Quotes at the end of unquoted values (eg inch marks) don't close quoted values
+    path.write_text('id,size\n1,5"\n2,6"\n3,x\n')
+    assert update_crate.count_records(path) == 4
+    path.write_text('id,size,notes\n1,5",""\n2,"6""",x"\n3,x,"a\nb"\n')
+    assert update_crate.count_records(path) == 4
+    # An unmatched quote falls back to the csv module
+    path.write_text('id,description\n1,"unfinished\n2,plain\n')
+    with path.open(newline="") as csv_file:
+        expected = len(list(csv.reader(csv_file)))
+    assert update_crate.count_records(path) == expected
+
+
+def test_count_last_line(update_crate, tmp_path):
+    path = tmp_path / "data.ndjson"
+    path.write_text('{"a": "\\""}\n{"b": 2}')
+    assert update_crate.count_records(path) == 2
+    path.write_text("")
+    assert update_crate.count_records(path) == 0
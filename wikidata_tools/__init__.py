@@ -0,0 +1,3 @@
+"""
+Shared helpers used by the Wikidata notebooks in this repository.
+"""
@@ -0,0 +1,58 @@
+"""
+Prepare agency data for display in the network graphs.
+
+Dates are parsed once for the whole dataframe, and the values used to position, colour
+and size each agency's node are added as columns, so the graph builders don't have to
+parse dates and calculate values one agency at a time.
+"""
+
+import pandas as pd
+
+EARLIEST_DATE = "1901-01-01"
+
+
+def parse_dates(series):
+    """
+    Convert a column of Wikidata dates to UTC datetimes (if they aren't already).
+    Missing or unparseable values (eg 'unknown value' blank nodes) become NaT.
+    """
+    return pd.to_datetime(series, utc=True, errors="coerce", format="ISO8601")
+
+
+def add_node_properties(
+    df,
+    start_col="start_date",
+    end_col="end_date",
+    biggest=150,
+    smallest=30,
+):
+    """
+    Add columns to a dataframe of agencies containing values used to style the graph nodes:
+
+    * `size` – based on each agency's length of existence, adjusted to fall within
+      the desired range (see: https://stackoverflow.com/a/929107)
+    * `level` – the year in which the agency was created, used to position the agency
+      hierarchically by creation date
+    * `group` – the decade in which the agency was created (eg '190'), used to colour the nodes
+
+    Agencies without an end date are treated as current. Agencies without a (known)
+    start date are left without a size, level and group.
+    """
+    now = pd.Timestamp.now(tz="UTC")
+    # Calculate the possible range of values for the length of an agency's existence
+    max_days = (now - pd.Timestamp(EARLIEST_DATE, tz="UTC")).days
+    min_days = 1
+    current_range = max_days - min_days
+    start_dates = parse_dates(df[start_col])
+    if end_col in df:
+        end_dates = parse_dates(df[end_col]).fillna(now)
+    else:
+        end_dates = pd.Series(now, index=df.index)
+    days = (end_dates - start_dates).dt.days
+    df = df.copy()
+    df["size"] = (((days - 1) * (biggest - smallest)) / current_range) + 20
+    # Agencies with an unknown start date have no level or group
+    years = start_dates.dt.year.astype("Int64")
+    df["level"] = years
+    df["group"] = years.floordiv(10).astype("string")
+    return df
@@ -0,0 +1,313 @@
+"""
+Create network graphs of the predecessors and successors of individual agencies.
+
+The styling used by `single-agency-network.ipynb` is kept here so that the same graphs
+can be exported in bulk. The export loads the complete lineage graph once (see
+`wikidata_tools.lineage`), finds the connections of every agency locally, and then
+renders the pages across a pool of processes. The result is a static site with a page
+for each agency and number of levels, and an index page linking to them all:
+
+    python -m wikidata_tools.agency_graphs --levels 2 3 4 5 --output agency-graphs
+"""
+
+import argparse
+import html
+import json
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from string import Template
+
+import pandas as pd
+from pyvis.network import Network
+from slugify import slugify
+from tqdm.auto import tqdm
+
+from wikidata_tools.agencies import add_node_properties
+from wikidata_tools.graphs import add_graph_data, write_compact_html
+from wikidata_tools.lineage import LineageIndex
+from wikidata_tools.store import get_store
+
+# Tableau style colours from http://tableaufriction.blogspot.com/2012/11/finally-you-can-use-tableau-data-colors.html
+RGB = [
+    "255.187.120",
+    "255.127.14",
+    "174.199.232",
+    "44.160.44",
+    "31.119.180",
+    "255.152.150",
+    "214.39.40",
+    "197.176.213",
+    "152.223.138",
+    "148.103.189",
+    "247.182.210",
+    "227.119.194",
+    "196.156.148",
+    "140.86.75",
+    "127.127.127",
+    "219.219.141",
+    "199.199.199",
+    "188.189.34",
+    "158.218.229",
+    "23.190.207",
+]
+
+# Number of graphs to send to each worker process at a time
+CHUNK_SIZE = 16
+
+
+def make_darker(colour, factor=0.75):
+    """
+    Darken colour by given factor.
+    """
+    return [str(round(int(c) * factor)) for c in colour]
+
+
+def make_lighter(colour, factor=0.75):
+    """
+    Lighten colour by given factor.
+    """
+    return [str(round((255 - int(c)) * factor) + int(c)) for c in colour]
+
+
+def get_decade_groups():
+    """
+    Create groups for each decade in the date range, assigning a different colour for each group.
+    """
+    colours = [f'rgb({",".join(r.split("."))})' for r in RGB]
+    borders = [f'rgb({",".join(make_darker(r.split(".")))})' for r in RGB]
+    highlights = [f'rgb({",".join(make_lighter(r.split(".")))})' for r in RGB]
+    decades = [str(d) for d in range(190, 203)]
+    return {
+        d: {
+            "color": {
+                "background": colours[i],
+                "border": borders[i],
+                "highlight": {"background": highlights[i], "border": borders[i]},
+            }
+        }
+        for i, d in enumerate(decades)
+    }
+
+
+DECADE_GROUPS = get_decade_groups()
+
+GRAPH_OPTIONS = {
+    "configure": {"enabled": False},
+    "layout": {
+        "hierarchical": {
+            "enabled": True,
+            "sortMethod": "directed",
+            "shakeTowards": "leaves",
+            "nodeSpacing": 20,
+            "levelSeparation": 20,
+            "treeSpacing": 20,
+        }
+    },
+    "physics": {"hierarchicalRepulsion": {"avoidOverlap": 1, "nodeDistance": 100}},
+    "nodes": {"font": {"size": 20}},
+    "groups": DECADE_GROUPS,
+    "edges": {
+        "arrows": {
+            "to": {"enabled": True, "scaleFactor": 0.5},
+            "arrowStrikethrough": False,
+        },
+        "smooth": {"enabled": True},
+        "color": {"color": "#b0bec5", "inherit": True},
+    },
+}
+
+INDEX_PAGE = Template(
+    """<html>
+<head>
+<meta charset="utf-8">
+<title>$title</title>
+<style>
+body { font-family: sans-serif; margin: 2em; }
+td { padding: 0.2em 1em 0.2em 0; }
+</style>
+</head>
+<body>
+<h1>$title</h1>
+<table>
+<thead><tr><th>Agency</th><th>NAA identifier</th><th>Levels</th></tr></thead>
+<tbody>
+$rows
+</tbody>
+</table>
+</body>
+</html>
+"""
+)
+
+
+def get_decade_highlight(decade):
+    if group := DECADE_GROUPS.get(decade):
+        return group["color"]["highlight"]["background"]
+
+
+def page_name(agency, levels):
+    return f"single-agency-{slugify(agency)}-{levels}.html"
+
+
+def get_agency_list(store=None):
+    """
+    Get the agencies that are an instance of 'Australian government agency' (or a subclass
+    of it) from the agency store, sorted by label.
+    """
+    store = store or get_store()
+    return (
+        store.get_agencies(instance="subclass")
+        .dropna(subset=["label"])
+        .sort_values(["label", "start_date"])
+        .reset_index(drop=True)
+    )
+
+
+def get_agency_data(lineage, starting_agency, levels):
+    """
+    Get the agencies connected to the starting agency from a `LineageIndex`, with
+    node sizes, levels and groups added.
+    """
+    return add_node_properties(lineage.get_lineage(starting_agency, levels))
+
+
+def make_agency_network(df, starting_agency, graph_options=GRAPH_OPTIONS):
+    """
+    Create a Pyvis network of an agency's connections, highlighting the selected agency.
+
+    Parameters:
+        df: a dataframe created by `get_agency_data()`
+        starting_agency: the Wikidata identifier of the selected agency
+        graph_options: vis.js options
+
+    Returns:
+        A Pyvis network
+    """
+    net = Network(notebook=True, layout=True, cdn_resources="remote")
+    selected = df["agency"].str.contains(starting_agency, regex=False)
+    nodes = pd.DataFrame(
+        {
+            "id": df["id"],
+            "label": df["id"],
+            "title": df["label"],
+            "group": df["group"],
+            "level": df["level"],
+            "size": df["size"],
+            "color": df["group"].map(get_decade_highlight).where(selected, ""),
+            "borderWidth": selected.map({True: 4, False: 1}),
+            "borderWidthSelected": selected.map({True: 4, False: 2}),
+        }
+    )
+    edges = df.dropna(subset=["after_id"])[["id", "after_id"]]
+    edges.columns = ["from", "to"]
+    # Edges to agencies outside the selected levels are dropped
+    net = add_graph_data(net, nodes, edges)
+    net.set_options(f"var options = {json.dumps(graph_options)}")
+    return net
+
+
+def render_page(task):
+    """
+    Save the graph of a single agency as a compact HTML page (run in a worker process).
+    """
+    df, starting_agency, path = task
+    return write_compact_html(make_agency_network(df, starting_agency), path)
+
+
+def write_index(agencies, levels, output, title="Australian government agencies"):
+    """
+    Save an index page with links to the graphs of every agency.
+    """
+    rows = []
+    for agency in agencies.itertuples():
+        links = " ".join(
+            f'<a href="{page_name(agency.agency, n)}">{n}</a>' for n in levels
+        )
+        rows.append(
+            f"<tr><td>{html.escape(agency.label)}</td><td>{html.escape(agency.id)}</td><td>{links}</td></tr>"
+        )
+    path = Path(output, "index.html")
+    path.write_text(
+        INDEX_PAGE.substitute(title=html.escape(title), rows="\n".join(rows))
+    )
+    return path
+
+
+def remove_stale_pages(output, pages):
+    """
+    Remove pages (and their data files) for agencies that are no longer in the list.
+    """
+    names = {Path(p).stem for p in pages}
+    for path in Path(output).glob("single-agency-*.html"):
+        if path.stem not in names:
+            for data_path in path.parent.glob(f"{path.stem}.*.json*"):
+                data_path.unlink()
+            path.unlink()
+
+
+def export_agency_graphs(levels=(2, 3, 4, 5), output="agency-graphs", workers=None):
+    """
+    Save graphs of every agency, at each of the given numbers of levels, as a static site.
+
+    Parameters:
+        levels: a list of the numbers of levels to include
+        output: the directory to save the site in
+        workers: the number of processes used to render graphs (defaults to the number of CPUs)
+
+    Returns:
+        The path of the index page
+    """
+    output = Path(output)
+    output.mkdir(parents=True, exist_ok=True)
+    store = get_store()
+    lineage = LineageIndex(store=store).load()
+    # Agencies with more than one NAA identifier or start date are listed more than once
+    agencies = get_agency_list(store).drop_duplicates("agency")
+    # Finding connections is quick (the lineage index groups the nodes and edges by agency
+    # when it's loaded), so it's done here and only the rendering is shared out
+    tasks = (
+        (
+            get_agency_data(lineage, agency, n),
+            agency,
+            Path(output, page_name(agency, n)),
+        )
+        for agency in agencies["agency"]
+        for n in levels
+    )
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pages = list(
+            tqdm(
+                executor.map(render_page, tasks, chunksize=CHUNK_SIZE),
+                total=len(agencies) * len(levels),
+            )
+        )
+    remove_stale_pages(output, pages)
+    return write_index(agencies, levels, output)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Export graphs of every Australian government agency as a static site."
+    )
+    parser.add_argument(
+        "--levels",
+        type=int,
+        nargs="+",
+        default=[2, 3, 4, 5],
+        help="Numbers of levels to include",
+    )
+    parser.add_argument(
+        "--output", default="agency-graphs", help="Directory to save the site in"
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        help="Number of graphs to render at once (defaults to the number of CPUs)",
+    )
+    args = parser.parse_args()
+    index = export_agency_graphs(args.levels, args.output, workers=args.workers)
+    print(f"Saved {index}")
+
+
+if __name__ == "__main__":
+    main()
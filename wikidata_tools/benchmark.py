@@ -0,0 +1,497 @@
+"""
+Time the processing stages the notebooks depend on, so changes to them can be measured.
+
+Each benchmark is run against synthetic versions of the agency and identifier datasets,
+scaled up by the given factors (eg 10 and 100 times the current number of agencies,
+identifiers and people). If there are recorded SPARQL responses (see `test_and_lint.sh`),
+reading and parsing them is timed as well. Nothing is fetched from the network.
+
+Results are added to a history file (default `.benchmarks.jsonl`), and compared with
+the best time from recent runs on the same machine. If any benchmark is slower than this
+by more than the tolerance, the run fails (exits with a non-zero status).
+
+    python -m wikidata_tools.benchmark --scales 1 10 100
+"""
+
+import argparse
+import datetime
+import itertools
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import warnings
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from wikidata_tools.agencies import add_node_properties
+from wikidata_tools.cooccurrence import cooccurrence_links
+from wikidata_tools.datasets import LINKS_SCHEMA, load_dataset, save_dataset
+from wikidata_tools.graphs import build_network, write_compact_html
+from wikidata_tools.layout import layered_layout
+from wikidata_tools.lineage import ENTITY_PREFIX, LineageIndex
+from wikidata_tools.results import parse_results
+from wikidata_tools.sparql import SparqlCache
+
+HISTORY_PATH = os.getenv("GW_BENCHMARK_HISTORY", ".benchmarks.jsonl")
+FIXTURES_DIR = os.getenv("SPARQL_FIXTURES", "fixtures/sparql")
+
+# Size of the synthetic datasets at a scale of 1 (roughly the size of the real data)
+AGENCIES = 1000
+PEOPLE = 10000
+PROPERTIES = 60
+TOPICS = ["arts", "politics", "sport", "other"]
+
+# A benchmark has regressed if it's this much slower than the best recent time...
+TOLERANCE = 0.25
+# ...and the difference is more than this many seconds (to ignore timer noise)
+MIN_DIFFERENCE = 0.005
+# Number of previous runs to compare against
+HISTORY_RUNS = 5
+
+XSD_DATETIME = "http://www.w3.org/2001/XMLSchema#dateTime"
+
+
+def literal(value, datatype=None):
+    binding = {"type": "literal", "value": value}
+    if datatype:
+        binding["datatype"] = datatype
+    return binding
+
+
+def make_agency_results(scale, seed=0):
+    """
+    Create SPARQL JSON results in the form returned by the agency network query,
+    with agencies, dates and successors chosen at random.
+    """
+    rng = np.random.default_rng(seed)
+    count = AGENCIES * scale
+    starts = rng.integers(1901, 2020, size=count)
+    ends = np.where(
+        rng.random(count) < 0.6, starts + rng.integers(1, 40, size=count), 0
+    )
+    bindings = []
+    for i, (start, end) in enumerate(zip(starts, ends)):
+        binding = {
+            "item": {"type": "uri", "value": f"{ENTITY_PREFIX}Q{i + 1}"},
+            "label": literal(f"Department {i} ({start}-{end or ''})"),
+            "id": literal(f"CA {i + 1}"),
+            "start_date": literal(f"{start}-01-01T00:00:00Z", XSD_DATETIME),
+        }
+        if end:
+            binding["end_date"] = literal(f"{end}-01-01T00:00:00Z", XSD_DATETIME)
+            # Replaced by one or two agencies
+            for after in rng.integers(0, count, size=rng.integers(1, 3)):
+                bindings.append({**binding, "after_id": literal(f"CA {after + 1}")})
+        else:
+            bindings.append(binding)
+    return json.dumps(
+        {
+            "head": {
+                "vars": ["item", "label", "id", "start_date", "end_date", "after_id"]
+            },
+            "results": {"bindings": bindings},
+        }
+    )
+
+
+def make_memberships(scale, seed=0):
+    """
+    Create (person, identifier) pairs for the co-occurrence benchmarks.
+    The number of identifiers grows with the square root of the scale,
+    so the number of identifier pairs grows roughly in line with the scale.
+    """
+    rng = np.random.default_rng(seed)
+    people = PEOPLE * scale
+    properties = round(PROPERTIES * scale**0.5)
+    # Some identifiers are much more common than others
+    weights = 1 / np.arange(1, properties + 1)
+    counts = rng.integers(1, 5, size=people)
+    items = np.repeat(np.arange(people), counts)
+    props = rng.choice(properties, size=len(items), p=weights / weights.sum())
+    memberships = pd.DataFrame(
+        {
+            "item": [f"{ENTITY_PREFIX}Q{i}" for i in items],
+            "property": [f"{ENTITY_PREFIX}P{p}" for p in props],
+        }
+    )
+    ids = pd.DataFrame(
+        {
+            "property": [f"{ENTITY_PREFIX}P{p}" for p in range(properties)],
+            "propertyLabel": [f"Identifier {p}" for p in range(properties)],
+        }
+    )
+    topics = pd.DataFrame(
+        {
+            "property": ids["property"],
+            "topic": rng.choice(TOPICS, size=properties),
+        }
+    )
+    return memberships, ids, topics
+
+
+def merge_topics(df_all, df_topics):
+    """
+    Add topics and target names to the identifier links, as in `visualise_all_people_ids.ipynb`.
+    """
+    sources = df_all[["source_prop", "source"]].drop_duplicates()
+    df_all = pd.merge(
+        df_all, df_topics, how="left", left_on="source_prop", right_on="property"
+    )
+    df_all = pd.merge(
+        df_all,
+        df_topics,
+        how="left",
+        left_on="target_prop",
+        right_on="property",
+        suffixes=["_source", "_target"],
+    )
+    df_all = pd.merge(
+        df_all,
+        sources,
+        how="left",
+        left_on="target_prop",
+        right_on="source_prop",
+        suffixes=[None, "_target"],
+    )
+    return df_all[
+        [
+            "source_prop",
+            "source",
+            "topic_source",
+            "target_prop",
+            "source_target",
+            "topic_target",
+            "count",
+        ]
+    ]
+
+
+def prepare_upset(df_all, min_count=20):
+    """
+    Select pairs of identifiers and create an UpSet plot (without drawing it),
+    as in `visualise_all_people_ids.ipynb`.
+    """
+    from upsetplot import UpSet, from_memberships
+
+    top_pairs = df_all.loc[
+        (df_all["source"] != df_all["source_target"])
+        & (df_all["count"] > min_count)
+        & (df_all["topic_source"].isin(["arts"]))
+        & (df_all["topic_target"].isin(["arts"]))
+    ].copy()
+    top_pairs["pair"] = top_pairs.apply(
+        lambda x: "|".join(sorted([x["source"], x["source_target"]])), axis=1
+    )
+    top_pairs = top_pairs.drop_duplicates(subset=["pair"])
+    # As in the notebook, hide upsetplot's warnings about future versions of pandas
+    with warnings.catch_warnings():
+        warnings.simplefilter(action="ignore", category=FutureWarning)
+        intersections = from_memberships(
+            top_pairs[["source", "source_target"]].values.tolist(), top_pairs
+        )
+        return UpSet(
+            intersections, sum_over="count", min_degree=2, sort_by="cardinality"
+        )
+
+
+def make_csv(path, scale, seed=0):
+    """
+    Write a CSV file with some quoted (multi-line) values, for the record counting benchmark.
+    """
+    rng = np.random.default_rng(seed)
+    rows = 20000 * scale
+    df = pd.DataFrame(
+        {
+            "id": np.arange(rows),
+            "label": [f"Agency {i}" for i in range(rows)],
+            "notes": np.where(
+                rng.random(rows) < 0.1, 'Some "quoted",\nmulti-line notes', "notes"
+            ),
+        }
+    )
+    df.to_csv(path, index=False)
+    return path
+
+
+def agency_benchmarks(scale, tmp_dir):
+    """
+    Benchmarks for the agency network and lineage notebooks.
+    Each benchmark is a function with no arguments, set up with its input data.
+    """
+    results = make_agency_results(scale)
+    df = parse_results(results)
+    df_props = add_node_properties(df)
+    nodes = pd.DataFrame(
+        {
+            "id": df_props["id"],
+            "label": df_props["id"],
+            "title": df_props["label"],
+            "group": df_props["group"],
+            "level": df_props["level"],
+            "size": df_props["size"],
+        }
+    )
+    edges = df_props.dropna(subset=["after_id"])[["id", "after_id"]]
+    edges.columns = ["from", "to"]
+    net = build_network(nodes, edges, notebook=True, cdn_resources="remote")
+    pages = itertools.count()
+
+    # Load the lineage index directly, in the form it would be fetched from Wikidata
+    lineage = LineageIndex()
+    agencies = df["item"].astype(str).str.replace(ENTITY_PREFIX, "")
+    lineage.nodes = (
+        df.assign(agency=agencies)[lineage.nodes.columns.drop("modified")]
+        .drop_duplicates(subset="agency")
+        .assign(modified=pd.Timestamp.now(tz="UTC"))
+    )
+    qids = dict(zip(df["id"], agencies))
+    lineage.edges = pd.DataFrame(
+        {"agency": agencies, "property": "P1366", "other": df["after_id"].map(qids)}
+    ).dropna()
+    lineage.add_edges(lineage.edges)
+    lineage.build_index()
+    starting = lineage.nodes["agency"].drop_duplicates().head(100).tolist()
+    # Make sure the lookups being timed actually find the agencies
+    assert all(len(lineage.get_lineage(a, 3)) for a in starting)
+
+    return {
+        "parse_json_normalize": lambda: pd.json_normalize(
+            json.loads(results)["results"]["bindings"]
+        ),
+        "parse_results": lambda: parse_results(results),
+        "node_properties": lambda: add_node_properties(df),
+        "graph_build": lambda: build_network(
+            nodes, edges, notebook=True, cdn_resources="remote"
+        ),
+        "layout": lambda: layered_layout(nodes, edges),
+        "write_html": lambda: write_compact_html(
+            net, Path(tmp_dir, f"agencies-{next(pages)}.html")
+        ),
+        "lineage": lambda: [lineage.get_lineage(a, 3) for a in starting],
+    }
+
+
+def identifier_benchmarks(scale, tmp_dir):
+    """
+    Benchmarks for the identifier co-occurrence notebook.
+    """
+    memberships, ids, topics = make_memberships(scale)
+    df_all = cooccurrence_links(memberships, ids)
+    df_merged = merge_topics(df_all, topics)
+    csv_path = Path(tmp_dir, "links.csv")
+    df_merged.to_csv(csv_path, index=False)
+    parquet_path = save_dataset(df_merged, Path(tmp_dir, "links.parquet"), LINKS_SCHEMA)
+    benchmarks = {
+        "cooccurrence": lambda: cooccurrence_links(memberships, ids),
+        "merges": lambda: merge_topics(df_all, topics),
+        "links_load_csv": lambda: pd.read_csv(csv_path),
+        "links_load_parquet": lambda: load_dataset(parquet_path),
+        "links_filter_parquet": lambda: load_dataset(
+            parquet_path, filters=[("topic_source", "==", "arts"), ("count", ">", 20)]
+        ),
+    }
+    try:
+        import upsetplot  # noqa: F401
+    except ImportError:
+        pass
+    else:
+        benchmarks["upset"] = lambda: prepare_upset(df_merged, min_count=20 * scale)
+    return benchmarks
+
+
+def crate_benchmarks(scale, tmp_dir):
+    """
+    Benchmarks for the slowest local parts of updating the RO-Crate metadata
+    (counting records in data files and hashing them). These are skipped if the
+    script can't be loaded.
+    """
+    sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "scripts"))
+    try:
+        from update_crate import count_records, hash_file
+    # The script has to be run from the root of the repository
+    except (ImportError, FileNotFoundError) as error:
+        print(f"Skipping crate benchmarks ({error})")
+        return {}
+    finally:
+        sys.path.pop(0)
+    csv_path = make_csv(Path(tmp_dir, "data.csv"), scale)
+    return {
+        "crate_count_records": lambda: count_records(csv_path),
+        "crate_hash_file": lambda: hash_file(csv_path),
+    }
+
+
+def fixture_benchmarks(fixtures_dir=FIXTURES_DIR):
+    """
+    Benchmarks for reading and parsing recorded SPARQL responses (if there are any).
+    """
+    cache = SparqlCache(fixtures_dir)
+    keys = [p.stem for p in Path(fixtures_dir).glob("*.json")]
+    if not keys:
+        return {}
+    responses = [cache.get(key, allow_stale=True) for key in keys]
+    return {
+        "fixtures_fetch": lambda: [cache.get(key, allow_stale=True) for key in keys],
+        "fixtures_parse": lambda: [parse_results(r) for r in responses],
+    }
+
+
+def time_benchmark(func, repeat=3):
+    """
+    Run a function several times, returning the fastest time in seconds.
+    """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def run_benchmarks(scales=(1, 10, 100), repeat=3, only=None):
+    """
+    Run all the benchmarks at each scale.
+
+    Parameters:
+        scales: a list of factors to multiply the size of the synthetic datasets by
+        repeat: the number of times to run each benchmark (the fastest time is kept)
+        only: a list of benchmark names to run (defaults to all)
+
+    Returns:
+        A dict of times in seconds, keyed by `<benchmark>@<scale>x`
+        (or `<benchmark>@recorded` for the recorded responses)
+    """
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        # Recorded responses aren't scaled, so they're only run once
+        for scale in [None] + list(scales):
+            if scale is None:
+                benchmarks = fixture_benchmarks()
+                label = "recorded"
+            else:
+                benchmarks = {}
+                for create in [
+                    agency_benchmarks,
+                    identifier_benchmarks,
+                    crate_benchmarks,
+                ]:
+                    benchmarks.update(create(scale, tmp_dir))
+                label = f"{scale}x"
+            for name, func in benchmarks.items():
+                if only and name not in only:
+                    continue
+                key = f"{name}@{label}"
+                results[key] = time_benchmark(func, repeat=repeat)
+                print(f"{key:<32}{results[key]:>10.4f}s")
+    return results
+
+
+def get_machine():
+    """
+    Identify the machine and Python version, so results are only compared with
+    runs in the same environment.
+    """
+    return f"{platform.node()} {platform.machine()} Python {platform.python_version()}"
+
+
+def get_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def load_history(path=HISTORY_PATH, machine=None, runs=HISTORY_RUNS):
+    """
+    Load the most recent results for this machine from the history file.
+    """
+    path = Path(path)
+    if not path.exists():
+        return []
+    history = [json.loads(line) for line in path.read_text().splitlines() if line]
+    machine = machine or get_machine()
+    return [h for h in history if h["machine"] == machine][-runs:]
+
+
+def find_regressions(results, history, tolerance=TOLERANCE):
+    """
+    Compare results with the best times in previous runs.
+
+    Returns:
+        A list of (benchmark, time, best previous time) for benchmarks that have slowed down
+    """
+    regressions = []
+    for key, seconds in results.items():
+        previous = [h["results"][key] for h in history if key in h["results"]]
+        if not previous:
+            continue
+        best = min(previous)
+        if seconds > best * (1 + tolerance) and seconds - best > MIN_DIFFERENCE:
+            regressions.append((key, seconds, best))
+    return regressions
+
+
+def save_results(results, path=HISTORY_PATH):
+    record = {
+        "date": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "commit": get_commit(),
+        "machine": get_machine(),
+        "results": results,
+    }
+    with Path(path).open("a") as history_file:
+        history_file.write(json.dumps(record) + "\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Time the processing stages used by the notebooks."
+    )
+    parser.add_argument(
+        "--scales",
+        type=int,
+        nargs="+",
+        default=[1, 10, 100],
+        help="Multiply the size of the synthetic datasets by these factors",
+    )
+    parser.add_argument(
+        "--repeat", type=int, default=3, help="Number of times to run each benchmark"
+    )
+    parser.add_argument(
+        "--only", nargs="+", help="Names of the benchmarks to run (defaults to all)"
+    )
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=TOLERANCE,
+        help="Fail if a benchmark is slower than its best recent time by more than this proportion",
+    )
+    parser.add_argument(
+        "--history", default=HISTORY_PATH, help="File to save results in"
+    )
+    parser.add_argument(
+        "--no-save", action="store_true", help="Don't add the results to the history"
+    )
+    args = parser.parse_args()
+    history = load_history(args.history)
+    results = run_benchmarks(args.scales, repeat=args.repeat, only=args.only)
+    regressions = find_regressions(results, history, tolerance=args.tolerance)
+    if not args.no_save:
+        save_results(results, args.history)
+    for key, seconds, best in regressions:
+        print(f"REGRESSION {key}: {seconds:.4f}s (best recent {best:.4f}s)")
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""
+Keep the data embedded in Altair charts small.
+
+Altair includes every column of a chart's dataframe in the chart specification, even if
+the columns aren't used, and stores dates as full ISO timestamps. Here the data is cut
+down to the fields used in the chart's encodings, and dates are saved as short strings.
+The data can also be saved to a separate CSV file that the chart loads by url, so the
+size of the chart specification doesn't depend on the number of rows.
+"""
+
+from pathlib import Path
+
+import altair as alt
+import pandas as pd
+
+from wikidata_tools.metrics import instrument
+
+
+def get_encoded_fields(chart):
+    """
+    Get the names of the data fields used in a chart's encodings (including tooltips).
+    """
+    spec = chart.copy(deep=False)
+    # Don't serialise the data just to find the fields
+    spec.data = alt.InlineData(values=[])
+    fields = []
+
+    def find_fields(value):
+        if isinstance(value, dict):
+            if isinstance(value.get("field"), str) and value["field"] not in fields:
+                fields.append(value["field"])
+            for v in value.values():
+                find_fields(v)
+        elif isinstance(value, list):
+            for v in value:
+                find_fields(v)
+
+    find_fields(spec.to_dict(validate=False).get("encoding", {}))
+    return fields
+
+
+def compact_data(df, fields, date_format="%Y-%m-%d"):
+    """
+    Get the columns of a dataframe used by a chart, converting dates to short strings.
+
+    Parameters:
+        df: the chart's dataframe
+        fields: a list of column names to keep
+        date_format: format for dates (the default keeps only the day)
+
+    Returns:
+        A dataframe
+    """
+    data = df[fields].copy()
+    for column in data.columns:
+        if pd.api.types.is_datetime64_any_dtype(data[column]):
+            data[column] = data[column].dt.strftime(date_format)
+    return data
+
+
+@instrument("chart", lambda result, chart, *args, **kwargs: {"rows": len(chart.data)})
+def compact_chart(chart, url=None, date_format="%Y-%m-%d"):
+    """
+    Reduce the size of an Altair chart by only including the data it uses.
+
+    Parameters:
+        chart: an Altair chart created from a dataframe
+        url: if supplied, save the data as a CSV file at this path and load it by url
+        date_format: format for dates (the default keeps only the day)
+
+    Returns:
+        A copy of the chart
+    """
+    data = compact_data(chart.data, get_encoded_fields(chart), date_format=date_format)
+    chart = chart.copy(deep=False)
+    if url:
+        Path(url).parent.mkdir(parents=True, exist_ok=True)
+        data.to_csv(url, index=False)
+        chart.data = alt.UrlData(url=str(url), format=alt.CsvDataFormat(type="csv"))
+    else:
+        chart.data = data
+    return chart
@@ -0,0 +1,145 @@
+"""
+Calculate how often pairs of identifiers are used together on Wikidata records,
+from a single list of the identifiers attached to each person.
+
+Instead of running a separate aggregation query for each identifier, we harvest the
+(person, identifier) pairs once and build a sparse person × identifier matrix. Multiplying
+the transposed matrix by itself gives an identifier × identifier matrix where each cell
+is the number of times the pair of identifiers occur together.
+
+The (person, identifier) pairs can also be harvested one identifier at a time, and one
+page at a time, using `iter_memberships()`. The matrix is then built up from each chunk
+of results, so the complete list of pairs never has to be held in memory.
+"""
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from wikidata_tools.sparql import PAGE_SIZE, get_dataframe, iter_pages
+
+# Get every Australian identifier attached to a person.
+# There's one row for every identifier value, so people with multiple values for the
+# same identifier are counted multiple times, as in the per-identifier aggregation queries.
+MEMBERSHIP_QUERY = """
+SELECT ?item ?property WHERE {
+  ?property wikibase:propertyType wikibase:ExternalId;
+      wdt:P17 wd:Q408;
+      wikibase:directClaim ?propertyclaim.
+  ?item ?propertyclaim [].
+  ?item wdt:P31 wd:Q5.
+}
+"""
+
+# Get every person with a value for a single identifier, in a stable order for paging.
+PROPERTY_MEMBERSHIP_QUERY = """
+SELECT ?item WHERE {{
+  ?item wdt:{} [];
+      wdt:P31 wd:Q5.
+}}
+ORDER BY ?item
+"""
+
+
+def get_memberships(query=MEMBERSHIP_QUERY, **kwargs):
+    """
+    Get a dataframe with `item` and `property` columns, one row for each identifier value.
+    Accepts the same keyword arguments as `wikidata_tools.sparql.get_response()`.
+    """
+    return get_dataframe(query, **kwargs)
+
+
+def iter_memberships(properties, page_size=PAGE_SIZE, **kwargs):
+    """
+    Harvest memberships one property (and one page of results) at a time.
+
+    Parameters:
+        properties: a list of property urls (eg `df_ids["property"]`)
+        page_size: the number of results to request at a time
+        kwargs: passed to `wikidata_tools.sparql.iter_pages()`
+
+    Yields:
+        Dataframes with `item` and `property` columns
+    """
+    for prop in properties:
+        query = PROPERTY_MEMBERSHIP_QUERY.format(prop.split("/")[-1])
+        for page in iter_pages(query, page_size=page_size, **kwargs):
+            yield page.assign(property=prop)
+
+
+def cooccurrence_matrix(memberships, weighted=True):
+    """
+    Calculate the co-occurrence of properties.
+
+    Parameters:
+        memberships: a dataframe with `item` and `property` columns,
+            or an iterable of dataframes (eg from `iter_memberships()`)
+        weighted: if True count every value (matching the `COUNT(*)` in the per-identifier
+            queries), if False count each person only once for each pair
+
+    Returns:
+        A sparse property × property matrix of counts, and an index of the property
+        ids corresponding to the rows and columns of the matrix
+    """
+    if isinstance(memberships, pd.DataFrame):
+        memberships = [memberships]
+    item_codes = {}
+    property_codes = {}
+    rows = []
+    cols = []
+    # Give each item and property a number, keeping only the numbers from each chunk
+    for chunk in memberships:
+        for column, codes, output in [
+            ("item", item_codes, rows),
+            ("property", property_codes, cols),
+        ]:
+            values = pd.Categorical(chunk[column])
+            lookup = np.array(
+                [codes.setdefault(v, len(codes)) for v in values.categories],
+                dtype=np.int64,
+            )
+            output.append(lookup[values.codes])
+    rows = np.concatenate(rows) if rows else np.array([], dtype=np.int64)
+    cols = np.concatenate(cols) if cols else np.array([], dtype=np.int64)
+    # Duplicate (item, property) entries are summed when the matrix is created
+    matrix = sparse.csr_matrix(
+        (np.ones(len(rows), dtype=np.int64), (rows, cols)),
+        shape=(len(item_codes), len(property_codes)),
+    )
+    if not weighted:
+        matrix.data[:] = 1
+    return (matrix.T @ matrix).tocoo(), pd.Index(list(property_codes))
+
+
+def cooccurrence_links(memberships, properties, weighted=True):
+    """
+    Create a dataframe of property pairs and their counts, using the same columns
+    as the results of the per-identifier queries (`target_prop`, `count`, `source`, `source_prop`).
+
+    Parameters:
+        memberships: a dataframe with `item` and `property` columns,
+            or an iterable of dataframes (eg from `iter_memberships()`)
+        properties: a dataframe with `property` and `propertyLabel` columns (eg `df_ids`)
+        weighted: passed to `cooccurrence_matrix()`
+
+    Returns:
+        A dataframe with a row for each pair of properties that occur together
+    """
+    matrix, index = cooccurrence_matrix(memberships, weighted=weighted)
+    df = pd.DataFrame(
+        {
+            "source_prop": index[matrix.row],
+            "target_prop": index[matrix.col],
+            "count": matrix.data,
+        }
+    )
+    # Order the results by source property (as in `properties`), then by count
+    order = {p: i for i, p in enumerate(properties["property"])}
+    df["order"] = df["source_prop"].map(order)
+    df = df.dropna(subset=["order"]).sort_values(
+        ["order", "count"], ascending=[True, False], kind="stable"
+    )
+    df["source"] = df["source_prop"].map(
+        dict(zip(properties["property"], properties["propertyLabel"]))
+    )
+    return df[["target_prop", "count", "source", "source_prop"]].reset_index(drop=True)
@@ -0,0 +1,146 @@
+"""
+Save harvested datasets as Parquet files.
+
+`visualise_all_people_ids.ipynb` creates tables of Australian identifiers and the links
+between them. As CSV files, every row repeats the full property urls, labels and topics
+as text, and reloading a file means parsing it all again and guessing the type of each
+column. Here the tables are saved as Parquet files with a fixed schema:
+
+* repeated text values are dictionary encoded, so each distinct value is only stored
+  once, and is loaded as a category rather than as a separate string in every row
+* numbers are stored as numbers, so nothing has to be parsed or inferred when the file
+  is loaded
+* `load_dataset()` can read just the columns that are needed, and filter rows (eg on
+  `topic_source` or `count`) as the file is read, rather than loading everything and then
+  filtering it in pandas
+
+CSV versions of the datasets can still be created for downloading using `export_csv()`.
+"""
+
+import os
+from pathlib import Path
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+import pyarrow.parquet as pq
+
+# Repeated text values are stored once per file
+CATEGORY = pa.dictionary(pa.int32(), pa.string())
+
+IDENTIFIERS_SCHEMA = pa.schema(
+    [
+        ("property", pa.string()),
+        ("propertyLabel", pa.string()),
+    ]
+)
+
+LINKS_SCHEMA = pa.schema(
+    [
+        ("source_prop", CATEGORY),
+        ("source", CATEGORY),
+        ("topic_source", CATEGORY),
+        ("target_prop", CATEGORY),
+        ("source_target", CATEGORY),
+        ("topic_target", CATEGORY),
+        ("count", pa.int64()),
+    ]
+)
+
+# Columns that are compared with each other, so need the same categories
+SHARED_CATEGORIES = [
+    ["source_prop", "target_prop"],
+    ["source", "source_target"],
+    ["topic_source", "topic_target"],
+]
+
+# Number of rows in each row group – filters can skip whole row groups
+ROW_GROUP_SIZE = 100000
+
+
+def save_dataset(df, path, schema=None, row_group_size=ROW_GROUP_SIZE):
+    """
+    Save a dataframe as a Parquet file.
+
+    Parameters:
+        df: the dataframe
+        path: the location of the file
+        schema: a pyarrow schema (eg `LINKS_SCHEMA`) – columns are selected and converted
+            to match it
+        row_group_size: the number of rows in each row group
+
+    Returns:
+        The path of the file
+    """
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    if schema:
+        table = table.select(schema.names).cast(schema)
+    path = Path(path)
+    # Write to a temporary file first so readers never see a partial file
+    tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    pq.write_table(table, tmp_path, row_group_size=row_group_size, compression="zstd")
+    tmp_path.replace(path)
+    return path
+
+
+def share_categories(df, groups=SHARED_CATEGORIES):
+    """
+    Give groups of category columns that are compared with each other
+    (eg `df["source_prop"] == df["target_prop"]`) the same categories.
+    Other category columns keep just the values they contain.
+    """
+    for group in groups:
+        columns = [
+            c for c in group if c in df and isinstance(df[c].dtype, pd.CategoricalDtype)
+        ]
+        if len(columns) < 2:
+            continue
+        categories = pd.Index(
+            sorted(set().union(*[df[c].cat.categories for c in columns]))
+        )
+        for column in columns:
+            df[column] = df[column].cat.set_categories(categories)
+    return df
+
+
+def load_dataset(path, columns=None, filters=None):
+    """
+    Load a dataset saved by `save_dataset()`.
+
+    Parameters:
+        path: the location of the file
+        columns: a list of columns to load (defaults to all columns)
+        filters: conditions that rows must match, in the format used by
+            `pyarrow.parquet.read_table()`, eg `[("topic_source", "==", "arts"), ("count", ">", 20)]`
+
+    Returns:
+        A dataframe, with dictionary encoded columns loaded as categories (shared
+        between the columns in `SHARED_CATEGORIES`)
+    """
+    table = pq.read_table(path, columns=columns, filters=filters)
+    return share_categories(table.to_pandas())
+
+
+def export_csv(path, csv_path=None):
+    """
+    Save a copy of a dataset as a CSV file.
+
+    Parameters:
+        path: the location of the Parquet file
+        csv_path: the location of the CSV file (defaults to the Parquet file's path
+            with a `.csv` suffix)
+
+    Returns:
+        The path of the CSV file
+    """
+    csv_path = Path(csv_path) if csv_path else Path(path).with_suffix(".csv")
+    table = pq.read_table(path)
+    # Write categories as plain text
+    schema = pa.schema(
+        [
+            (f.name, f.type.value_type) if pa.types.is_dictionary(f.type) else f
+            for f in table.schema
+        ]
+    )
+    pa_csv.write_csv(table.cast(schema), csv_path)
+    return csv_path
@@ -0,0 +1,241 @@
+"""
+Build Pyvis network graphs from dataframes of nodes and edges.
+
+Pyvis's `add_node()` and `add_edge()` check for existing nodes by searching a list, so
+adding nodes and edges one at a time gets slow as graphs grow. Here the vis.js node and
+edge data are created from whole dataframes, and edges that point to missing nodes are
+dropped with a single join, rather than by catching an `AssertionError` for each edge.
+
+Networks can also be saved as a small HTML page that loads the graph data from a separate
+JSON file, rather than inlining the data (and possibly the whole vis.js library) in every page.
+"""
+
+import gzip
+import hashlib
+import json
+import math
+from pathlib import Path
+from string import Template
+
+import pandas as pd
+from IPython.display import IFrame
+from pyvis.network import Network
+
+from wikidata_tools.metrics import instrument
+
+DEFAULT_NODE_COLOUR = "#97c2fc"
+
+
+def to_records(df):
+    """
+    Convert a dataframe to a list of dicts, leaving out any missing values.
+    """
+    return [
+        {
+            k: v
+            for k, v in record.items()
+            if v is not None
+            and v is not pd.NA
+            and not (isinstance(v, float) and math.isnan(v))
+        }
+        for record in df.to_dict(orient="records")
+    ]
+
+
+def get_graph_data(nodes, edges, directed=False, shape="dot", font_color=False):
+    """
+    Create vis.js node and edge data from dataframes.
+    Defaults are applied in the same way as Pyvis's `add_node()` and `add_edge()`.
+
+    Parameters:
+        nodes: a dataframe with an `id` column and columns for any other vis.js node options
+        edges: a dataframe with `from` and `to` columns and columns for any other vis.js edge options
+        directed: if False, edges that duplicate an existing edge in the other direction are removed
+        shape: the default node shape
+        font_color: colour of the node labels
+
+    Returns:
+        A list of node dicts and a list of edge dicts
+    """
+    # Like add_node(), keep the first node with each id
+    nodes = nodes.drop_duplicates(subset="id").copy()
+    if "label" in nodes:
+        nodes["label"] = nodes["label"].where(
+            nodes["label"].notna() & (nodes["label"] != ""), nodes["id"]
+        )
+    else:
+        nodes["label"] = nodes["id"]
+    if "shape" not in nodes:
+        nodes["shape"] = shape
+    if "color" not in nodes and "group" not in nodes:
+        nodes["color"] = DEFAULT_NODE_COLOUR
+    node_records = to_records(nodes)
+    if font_color:
+        for node in node_records:
+            node["font"] = {"color": font_color}
+    # Drop edges where either end is not in the list of nodes
+    edges = edges.loc[edges["from"].isin(nodes["id"]) & edges["to"].isin(nodes["id"])]
+    if directed:
+        if "arrows" not in edges:
+            edges = edges.assign(arrows="to")
+    else:
+        pairs = [frozenset(pair) for pair in zip(edges["from"], edges["to"])]
+        edges = edges.loc[~edges.assign(pair=pairs).duplicated(subset="pair")]
+    return node_records, to_records(edges)
+
+
+@instrument("graph_build", lambda net, *args, **kwargs: {"rows": len(net.nodes)})
+def add_graph_data(net, nodes, edges):
+    """
+    Replace the nodes and edges of a Pyvis network with data from dataframes.
+    See `get_graph_data()` for the expected columns.
+    """
+    node_records, edge_records = get_graph_data(
+        nodes,
+        edges,
+        directed=net.directed,
+        shape=net.shape,
+        font_color=net.font_color,
+    )
+    net.nodes = node_records
+    net.node_ids = [n["id"] for n in node_records]
+    net.node_map = {n["id"]: n for n in node_records}
+    net.edges = edge_records
+    return net
+
+
+def build_network(nodes, edges, **kwargs):
+    """
+    Create a Pyvis network from dataframes of nodes and edges.
+    Keyword arguments are passed to `Network()`.
+    """
+    return add_graph_data(Network(**kwargs), nodes, edges)
+
+
+VIS_JS = (
+    "https://cdnjs.cloudflare.com/ajax/libs/vis-network/9.1.2/dist/vis-network.min.js"
+)
+VIS_CSS = "https://cdnjs.cloudflare.com/ajax/libs/vis-network/9.1.2/dist/dist/vis-network.min.css"
+
+# A minimal page that loads the graph data from a separate JSON file.
+# Titles that contain links are shown in a popup that stays open while the mouse is
+# over it (as in Pyvis's own template), so the links can be clicked.
+HTML_SHELL = Template(
+    """<html>
+<head>
+<meta charset="utf-8">
+<link rel="stylesheet" href="$vis_css">
+<script src="$vis_js"></script>
+<style>
+#mynetwork { width: $width; height: $height; border: 1px solid lightgray; position: relative; }
+.link-popups .vis-tooltip { display: none; }
+div.popup { position: absolute; display: none; background-color: #f5f4ed; border: 1px solid #808074; border-radius: 3px; box-shadow: 3px 3px 10px rgba(0, 0, 0, 0.2); }
+</style>
+</head>
+<body>
+<div id="mynetwork"></div>
+<script>
+async function loadGraph(url) {
+  const response = await fetch(url);
+  if (url.endsWith(".gz")) {
+    return new Response(response.body.pipeThrough(new DecompressionStream("gzip"))).json();
+  }
+  return response.json();
+}
+loadGraph("$data_url").then(function (data) {
+  var container = document.getElementById("mynetwork");
+  var nodes = new vis.DataSet(data.nodes);
+  var edges = new vis.DataSet(data.edges);
+  var network = new vis.Network(container, {nodes: nodes, edges: edges}, data.options);
+  if (data.nodes.some(function (n) { return n.title && n.title.includes("href"); })) {
+    var popup = document.createElement("div");
+    var popupTimeout = null;
+    popup.className = "popup";
+    container.classList.add("link-popups");
+    container.appendChild(popup);
+    function hidePopup() {
+      popupTimeout = setTimeout(function () { popup.style.display = "none"; }, 500);
+    }
+    popup.addEventListener("mouseover", function () { clearTimeout(popupTimeout); });
+    popup.addEventListener("mouseout", hidePopup);
+    network.on("hidePopup", hidePopup);
+    network.on("showPopup", function (nodeId) {
+      clearTimeout(popupTimeout);
+      popup.innerHTML = nodes.get(nodeId).title;
+      var pos = network.getPositions([nodeId])[nodeId];
+      var box = network.getBoundingBox(nodeId);
+      pos.x = pos.x + 0.5 * (box.right - box.left);
+      var dom = network.canvasToDOM(pos);
+      popup.style.display = "block";
+      popup.style.top = dom.y - 20 + "px";
+      popup.style.left = dom.x + 10 + "px";
+    });
+  }
+});
+</script>
+</body>
+</html>
+"""
+)
+
+
+@instrument("render", lambda path, net, *args, **kwargs: {"rows": len(net.nodes)})
+def write_compact_html(net, path, compress=False, vis_js=VIS_JS, vis_css=VIS_CSS):
+    """
+    Save a Pyvis network as a small HTML page that loads the graph data (nodes, edges and
+    options) from a separate JSON file, instead of inlining the data and vis.js library.
+
+    The data file is saved alongside the HTML file, and its name includes a hash of its
+    contents, so unchanged data is never rewritten and browsers can cache it safely.
+    Note that the page has to be served over HTTP (as in Jupyter or on the web) so that
+    the data can be loaded.
+
+    Parameters:
+        net: a Pyvis network
+        path: where to save the HTML file
+        compress: save the data as gzipped JSON
+        vis_js: url of the vis-network library (eg a shared local copy)
+        vis_css: url of the vis-network stylesheet
+
+    Returns:
+        The path of the HTML file
+    """
+    path = Path(path)
+    nodes, edges, _, height, width, options = net.get_network_data()
+    # Sizes can be given to Pyvis as numbers, but CSS needs units
+    height, width = [
+        f"{v}px" if isinstance(v, (int, float)) else v for v in (height, width)
+    ]
+    data = json.dumps(
+        {"nodes": nodes, "edges": edges, "options": json.loads(options)},
+        separators=(",", ":"),
+    ).encode("utf-8")
+    suffix = ".json.gz" if compress else ".json"
+    data_path = path.with_name(
+        f"{path.stem}.{hashlib.sha256(data).hexdigest()[:10]}{suffix}"
+    )
+    if not data_path.exists():
+        # Remove data saved for previous versions of this graph (another process
+        # might be removing them at the same time)
+        for old_path in path.parent.glob(f"{path.stem}.*.json*"):
+            old_path.unlink(missing_ok=True)
+        data_path.write_bytes(gzip.compress(data, mtime=0) if compress else data)
+    path.write_text(
+        HTML_SHELL.substitute(
+            vis_js=vis_js,
+            vis_css=vis_css,
+            width=width,
+            height=height,
+            data_url=data_path.name,
+        )
+    )
+    return path
+
+
+def show_compact_html(net, path, **kwargs):
+    """
+    Save a network with `write_compact_html()` and display it in an IFrame.
+    This is a replacement for `net.show()`.
+    """
+    path = write_compact_html(net, path, **kwargs)
+    return IFrame(str(path), width=net.width, height=net.height)
@@ -0,0 +1,227 @@
+"""
+Run a batch of SPARQL queries concurrently, while respecting the rate limits of the
+Wikidata Query Service.
+
+Queries are shared across a small pool of worker threads. If the endpoint responds with a
+429 (Too Many Requests) or a temporary server error, the worker waits for the period
+given in the `Retry-After` header (or an increasing backoff if there isn't one), and all
+workers slow down until requests start succeeding again. The results of completed queries
+are saved to a checkpoint file, so an interrupted harvest can pick up where it stopped.
+The checkpoint is removed once every query has finished, so the next harvest gets fresh
+results.
+"""
+
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from email.utils import parsedate_to_datetime
+from pathlib import Path
+from urllib.error import HTTPError, URLError
+
+import pandas as pd
+from tqdm.auto import tqdm
+
+from wikidata_tools.metrics import get_metrics
+from wikidata_tools.sparql import WIKIDATA_ENDPOINT, get_dataframe
+
+# The Wikidata Query Service allows up to 5 concurrent queries per client
+MAX_WORKERS = 3
+MAX_RETRIES = 5
+RETRY_STATUSES = [429, 502, 503, 504]
+
+
+class RateLimiter:
+    """
+    Spaces out requests across threads, increasing the delay between requests when
+    the endpoint asks us to slow down, and relaxing it again after successful requests.
+    """
+
+    def __init__(self, min_delay=0, max_delay=300, backoff=2, recovery=0.5):
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.backoff = backoff
+        self.recovery = recovery
+        self.delay = min_delay
+        self.next_request = 0
+        self.lock = threading.Lock()
+
+    def wait(self):
+        """
+        Block until the next request is allowed.
+        """
+        with self.lock:
+            now = time.monotonic()
+            start = max(now, self.next_request)
+            self.next_request = start + self.delay
+        time.sleep(start - now)
+
+    def success(self):
+        with self.lock:
+            self.delay = max(self.min_delay, self.delay * self.recovery)
+
+    def throttle(self, retry_after=None):
+        """
+        Slow down after the endpoint has refused a request.
+        Returns the number of seconds to wait before retrying.
+        """
+        with self.lock:
+            self.delay = min(self.max_delay, max(self.delay * self.backoff, 1))
+            wait = retry_after if retry_after is not None else self.delay
+            self.next_request = max(self.next_request, time.monotonic() + wait)
+        return wait
+
+
+def get_retry_after(error):
+    """
+    Get the number of seconds to wait from an error's Retry-After header (if any).
+    The header can either be a number of seconds or a HTTP date.
+    """
+    headers = getattr(error, "headers", None) or {}
+    value = headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0, float(value))
+    except ValueError:
+        try:
+            return max(0, parsedate_to_datetime(value).timestamp() - time.time())
+        except (TypeError, ValueError):
+            return None
+
+
+class Harvester:
+    """
+    Harvest the results of a set of SPARQL queries using a pool of worker threads.
+
+    Parameters:
+        checkpoint: path to a file used to save completed results
+        max_workers: the number of queries to run at the same time
+        max_retries: the number of times to retry a query after a rate limit or server error
+        min_delay: the minimum number of seconds between requests
+        endpoint: url of the SPARQL endpoint
+    """
+
+    def __init__(
+        self,
+        checkpoint=None,
+        max_workers=MAX_WORKERS,
+        max_retries=MAX_RETRIES,
+        min_delay=0,
+        endpoint=WIKIDATA_ENDPOINT,
+    ):
+        self.checkpoint = Path(checkpoint) if checkpoint else None
+        self.max_workers = max_workers
+        self.max_retries = max_retries
+        self.endpoint = endpoint
+        self.limiter = RateLimiter(min_delay=min_delay)
+        self.lock = threading.Lock()
+        self.stats = {}
+
+    def load_checkpoint(self):
+        """
+        Load results saved by a previous harvest.
+        """
+        completed = {}
+        if self.checkpoint and self.checkpoint.exists():
+            with self.checkpoint.open("r") as checkpoint_file:
+                for line in checkpoint_file:
+                    try:
+                        saved = json.loads(line)
+                    except json.JSONDecodeError:
+                        # Ignore a partial line left by a crash
+                        continue
+                    completed[saved["key"]] = pd.DataFrame(
+                        saved["rows"], columns=saved["columns"]
+                    )
+        return completed
+
+    def save_checkpoint(self, key, df):
+        if self.checkpoint:
+            saved = {
+                "key": key,
+                "columns": df.columns.to_list(),
+                "rows": df.to_dict(orient="records"),
+            }
+            with self.lock:
+                with self.checkpoint.open("a") as checkpoint_file:
+                    # Typed values such as dates are saved as strings
+                    checkpoint_file.write(json.dumps(saved, default=str) + "\n")
+
+    def run_query(self, query):
+        """
+        Run a single query, retrying if the endpoint asks us to slow down.
+        Returns the results as a dataframe and the number of retries.
+        """
+        retries = 0
+        while True:
+            self.limiter.wait()
+            try:
+                df = get_dataframe(query, self.endpoint)
+            except (HTTPError, URLError) as e:
+                status = getattr(e, "code", None)
+                if (
+                    isinstance(e, HTTPError) and status not in RETRY_STATUSES
+                ) or retries >= self.max_retries:
+                    raise
+                retries += 1
+                wait = self.limiter.throttle(get_retry_after(e))
+                get_metrics().record("retry", wait, status=status, retries=1)
+                time.sleep(wait)
+            else:
+                self.limiter.success()
+                return df, retries
+
+    def harvest(self, queries):
+        """
+        Run a set of queries, skipping any that were completed in a previous
+        (interrupted) harvest. If a query fails, queries that haven't started yet
+        are cancelled before the error is raised.
+
+        Parameters:
+            queries: a dict of queries, keyed by an identifier for each query
+
+        Returns:
+            A dict of dataframes with the results of each query, using the same keys
+        """
+        results = self.load_checkpoint()
+        todo = {k: q for k, q in queries.items() if k not in results}
+        start = time.monotonic()
+        retries = 0
+        rows = 0
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = {executor.submit(self.run_query, q): k for k, q in todo.items()}
+            try:
+                for future in tqdm(as_completed(futures), total=len(futures)):
+                    key = futures[future]
+                    df, query_retries = future.result()
+                    self.save_checkpoint(key, df)
+                    results[key] = df
+                    retries += query_retries
+                    rows += len(df)
+            except BaseException:
+                # Don't send the queries that are still waiting, but save the results
+                # of any that finished, so they aren't run again when the harvest resumes
+                executor.shutdown(cancel_futures=True)
+                for future, key in futures.items():
+                    if key not in results and not future.cancelled():
+                        if future.exception() is None:
+                            self.save_checkpoint(key, future.result()[0])
+                raise
+        elapsed = time.monotonic() - start
+        # The harvest is complete, so don't reuse these results next time
+        if self.checkpoint:
+            self.checkpoint.unlink(missing_ok=True)
+        self.stats = {
+            "queries": len(todo),
+            "resumed": len(queries) - len(todo),
+            "rows": rows,
+            "retries": retries,
+            "seconds": round(elapsed, 2),
+            "queries_per_second": round(len(todo) / elapsed, 2) if elapsed else None,
+        }
+        print(
+            f"Harvested {len(todo)} queries ({rows:,} rows) in {elapsed:.1f} seconds "
+            f"with {retries} retries; {len(queries) - len(todo)} loaded from checkpoint"
+        )
+        return {k: results[k] for k in queries}
@@ -0,0 +1,242 @@
+"""
+An in-memory index of the predecessors and successors of Australian government agencies.
+
+The whole lineage graph (every agency with an NAA identifier, plus their 'replaces' (P1365)
+and 'replaced by' (P1366) statements) is loaded from Wikidata once. Requests for the
+agencies connected to a particular agency are then answered locally with a breadth-first
+search, rather than by sending a SPARQL property path query for every request.
+The graph can also be loaded from a local `wikidata_tools.store.AgencyStore`.
+"""
+
+from collections import deque
+
+import numpy as np
+import pandas as pd
+
+from wikidata_tools.metrics import instrument
+from wikidata_tools.sparql import WIKIDATA_ENDPOINT, get_dataframe
+
+ENTITY_PREFIX = "http://www.wikidata.org/entity/"
+PROP_PREFIX = "http://www.wikidata.org/prop/direct/"
+REPLACES = "P1365"
+REPLACED_BY = "P1366"
+
+NODES_QUERY = """
+SELECT ?agency ?label ?id ?start_date ?end_date ?modified
+  WHERE {{
+    ?agency wdt:P10856 ?id;
+            wdt:P571 ?start_date;
+            rdfs:label ?agency_label;
+            schema:dateModified ?modified.
+    OPTIONAL {{ ?agency wdt:P576 ?end_date. }}
+    FILTER (lang(?agency_label) = "en").
+    {}
+    # Combine start and end year into a single string, setting end date to "" if it doesn't exist
+    BIND(concat(xsd:string(YEAR(?start_date)), "-", COALESCE(xsd:string(YEAR(?end_date)), "")) as ?date_range)
+    # Combine dept name and date range into a single string
+    BIND(concat(?agency_label, " (", ?date_range, ")") as ?label)
+}}
+"""
+
+EDGES_QUERY = """
+SELECT ?agency ?property ?other
+  WHERE {{
+    ?agency wdt:P10856 [];
+            schema:dateModified ?modified.
+    VALUES ?property {{ wdt:P1365 wdt:P1366 }}
+    ?agency ?property ?other.
+    {}
+}}
+"""
+
+MODIFIED_FILTER = 'FILTER (?modified > "{}"^^xsd:dateTime)'
+
+LINEAGE_COLUMNS = [
+    "agency",
+    "label",
+    "id",
+    "start_date",
+    "end_date",
+    "after",
+    "after_id",
+]
+
+
+def strip_prefix(series, prefix):
+    return series.str.replace(prefix, "", regex=False)
+
+
+def select_rows(df, index, agencies):
+    """
+    Get the rows for a set of agencies from a dataframe, in their original order.
+
+    Parameters:
+        df: a dataframe
+        index: a dict of row positions in the dataframe, keyed by agency
+        agencies: a list of Wikidata identifiers
+    """
+    rows = [index[a] for a in agencies if a in index]
+    positions = np.sort(np.concatenate(rows)) if rows else []
+    return df.iloc[positions]
+
+
+class LineageIndex:
+    """
+    Holds the agency lineage graph as an adjacency index.
+
+    Parameters:
+        endpoint: url of the SPARQL endpoint
+        store: an `AgencyStore` to load the graph from, instead of querying the endpoint
+    """
+
+    def __init__(self, endpoint=WIKIDATA_ENDPOINT, store=None):
+        self.endpoint = endpoint
+        self.store = store
+        self.nodes = pd.DataFrame(
+            columns=["agency", "label", "id", "start_date", "end_date", "modified"]
+        )
+        self.edges = pd.DataFrame(columns=["agency", "property", "other"])
+        self.adjacency = {}
+        # Row positions of each agency's details and successors, see `build_index()`
+        self.node_rows = {}
+        self.successors = pd.DataFrame(columns=["agency", "other", "after_id"])
+        self.successor_rows = {}
+        self.last_modified = None
+
+    def fetch(self, since=None):
+        """
+        Get agency details and lineage statements from Wikidata.
+        If `since` is supplied, only get agencies modified after that date.
+        """
+        modified_filter = (
+            MODIFIED_FILTER.format(since.strftime("%Y-%m-%dT%H:%M:%SZ"))
+            if since
+            else ""
+        )
+        # Changes need to be fetched fresh, but the full graph can come from the cache
+        kwargs = {"ttl": 0} if since else {}
+        nodes = get_dataframe(
+            NODES_QUERY.format(modified_filter), self.endpoint, **kwargs
+        )
+        edges = get_dataframe(
+            EDGES_QUERY.format(modified_filter), self.endpoint, **kwargs
+        )
+        nodes["agency"] = strip_prefix(nodes["agency"], ENTITY_PREFIX)
+        edges["agency"] = strip_prefix(edges["agency"], ENTITY_PREFIX)
+        edges["other"] = strip_prefix(edges["other"], ENTITY_PREFIX)
+        edges["property"] = strip_prefix(edges["property"], PROP_PREFIX)
+        # Date columns without any values can't be typed from the results
+        for col in ["start_date", "end_date", "modified"]:
+            nodes[col] = pd.to_datetime(nodes[col], utc=True)
+        return nodes, edges
+
+    def read_store(self):
+        """
+        Get agency details and lineage statements from the store.
+        """
+        nodes = self.store.get_agencies()
+        # Like NODES_QUERY, only include agencies with an English label
+        nodes = nodes.dropna(subset=["label"]).reset_index(drop=True)
+        return nodes[self.nodes.columns], self.store.get_edges()
+
+    def load(self):
+        """
+        Load the complete lineage graph.
+        """
+        nodes, edges = self.read_store() if self.store else self.fetch()
+        self.nodes = nodes
+        self.edges = edges
+        self.adjacency = {}
+        self.add_edges(edges)
+        self.build_index()
+        self.last_modified = nodes["modified"].max() if not nodes.empty else None
+        return self
+
+    def refresh(self):
+        """
+        Update the index with agencies that have been modified since it was last loaded.
+        """
+        if self.store:
+            # The store only fetches the changes, and rebuilding the index locally is quick
+            self.store.refresh()
+            return self.load()
+        if self.last_modified is None:
+            return self.load()
+        nodes, edges = self.fetch(since=self.last_modified)
+        changed = set(nodes["agency"]) | set(edges["agency"])
+        if not nodes.empty:
+            self.last_modified = max(self.last_modified, nodes["modified"].max())
+        if changed:
+            # Replace the details and outgoing edges of the changed agencies
+            self.nodes = pd.concat(
+                [self.nodes.loc[~self.nodes["agency"].isin(changed)], nodes],
+                ignore_index=True,
+            )
+            self.edges = pd.concat(
+                [self.edges.loc[~self.edges["agency"].isin(changed)], edges],
+                ignore_index=True,
+            )
+            for agency in changed:
+                self.adjacency.pop(agency, None)
+            self.add_edges(edges)
+            self.build_index()
+        return self
+
+    def add_edges(self, edges):
+        for agency, other in zip(edges["agency"], edges["other"]):
+            self.adjacency.setdefault(agency, set()).add(other)
+
+    def build_index(self):
+        """
+        Find the rows of each agency's details and successors once, so that a lineage
+        request only has to touch the rows it returns.
+        """
+        # Successors are only included if they have an NAA identifier
+        ids = self.nodes[["agency", "id"]].drop_duplicates()
+        ids.columns = ["other", "after_id"]
+        self.successors = (
+            self.edges.loc[self.edges["property"] == REPLACED_BY, ["agency", "other"]]
+            .merge(ids, on="other")
+            .reset_index(drop=True)
+        )
+        self.node_rows = self.nodes.groupby("agency", sort=False).indices
+        self.successor_rows = self.successors.groupby("agency", sort=False).indices
+
+    def get_connected(self, starting_agency, levels):
+        """
+        Find all the agencies within the given number of steps of the starting agency,
+        following both 'replaces' and 'replaced by' statements.
+
+        Parameters:
+            starting_agency: a Wikidata identifier, eg 'Q16956162'
+            levels: the maximum number of steps
+
+        Returns:
+            A set of Wikidata identifiers, including the starting agency
+        """
+        found = {starting_agency}
+        queue = deque([(starting_agency, 0)])
+        while queue:
+            agency, depth = queue.popleft()
+            if depth == levels:
+                continue
+            for other in self.adjacency.get(agency, ()):
+                if other not in found:
+                    found.add(other)
+                    queue.append((other, depth + 1))
+        return found
+
+    @instrument("lineage", lambda df, *args, **kwargs: {"rows": len(df)})
+    def get_lineage(self, starting_agency, levels):
+        """
+        Get details of the agencies connected to the starting agency, and their successors.
+        The columns of the dataframe match the results of a SPARQL property path query
+        (`agency`, `label`, `id`, `start_date`, `end_date`, `after`, `after_id`).
+        """
+        connected = self.get_connected(starting_agency, levels)
+        nodes = select_rows(self.nodes, self.node_rows, connected)
+        successors = select_rows(self.successors, self.successor_rows, connected)
+        df = nodes.merge(successors, on="agency", how="left")
+        df["agency"] = ENTITY_PREFIX + df["agency"]
+        df["after"] = ENTITY_PREFIX + df["other"]
+        return df[LINEAGE_COLUMNS].drop_duplicates().reset_index(drop=True)
@@ -0,0 +1,260 @@
+"""
+Run the notebooks' SPARQL queries against a local extract of Wikidata.
+
+The Wikidata Query Service is rate limited, heavy aggregations (like the per-identifier
+counts in `visualise_all_people_ids.ipynb`) can hit its time limit, and it can't be
+reached without a network connection. The notebooks only use a small part of Wikidata,
+so this module extracts that part into a compressed N-Triples file:
+
+* every item with an NAA identifier (P10856), with its NAA identifier, instance of (P31),
+  inception (P571), dissolution (P576), replaces (P1365), replaced by (P1366),
+  English label, and modification date
+* the subclasses (P279) of Australian government agency (Q57605562)
+* the Australian (P17 Q408) external identifier properties, with their English labels
+* every person (P31 Q5) with one of those identifiers, and their identifier values
+
+The extract is created by running a set of queries against the Query Service:
+
+    python -m wikidata_tools.local --output wikidata-subset.nt.gz
+
+Queries can then be sent to the extract by using an endpoint of the form
+`file:<path to extract>`, either directly (eg `get_dataframe(query, "file:wikidata-subset.nt.gz")`)
+or by setting the `GW_SPARQL_ENDPOINT` environment variable before starting Jupyter.
+The extract is loaded into an in-memory RDF graph (using RDFLib) the first time it's
+queried, and the results are returned in the same JSON format as the Query Service, so
+they're cached, timed, and parsed in the same way as any other response (see
+`wikidata_tools.sparql`).
+
+The Query Service's standard prefixes are predefined, and the label service
+(`SERVICE wikibase:label`) is replaced with optional `rdfs:label` patterns. Unlike
+the label service, a variable like `?propertyLabel` is left unbound if there's no label.
+"""
+
+import argparse
+import gzip
+import re
+import threading
+from pathlib import Path
+
+import rdflib
+from rdflib import BNode, Graph, Literal, Namespace, URIRef
+
+from wikidata_tools.harvest import Harvester
+from wikidata_tools.sparql import WIKIDATA_QUERY_SERVICE, run_query
+
+OUTPUT_PATH = "wikidata-subset.nt.gz"
+
+WD = Namespace("http://www.wikidata.org/entity/")
+WDT = Namespace("http://www.wikidata.org/prop/direct/")
+
+# The prefixes predefined by the Wikidata Query Service that are used in the notebooks
+PREFIXES = {
+    "wd": WD,
+    "wdt": WDT,
+    "wikibase": Namespace("http://wikiba.se/ontology#"),
+    "p": Namespace("http://www.wikidata.org/prop/"),
+    "ps": Namespace("http://www.wikidata.org/prop/statement/"),
+    "pq": Namespace("http://www.wikidata.org/prop/qualifier/"),
+    "rdfs": Namespace("http://www.w3.org/2000/01/rdf-schema#"),
+    "schema": Namespace("http://schema.org/"),
+    "skos": Namespace("http://www.w3.org/2004/02/skos/core#"),
+    "xsd": Namespace("http://www.w3.org/2001/XMLSchema#"),
+    "bd": Namespace("http://www.bigdata.com/rdf#"),
+}
+
+# Queries that return the triples to extract as ?s ?p ?o
+AGENCIES_QUERY = """
+SELECT ?s ?p ?o
+WHERE {
+  ?s wdt:P10856 [].
+  VALUES ?p { wdt:P10856 wdt:P31 wdt:P571 wdt:P576 wdt:P1365 wdt:P1366 rdfs:label schema:dateModified }
+  ?s ?p ?o.
+  FILTER (?p != rdfs:label || lang(?o) = "en")
+}
+"""
+
+CLASSES_QUERY = """
+SELECT ?s ?p ?o
+WHERE {
+  ?s wdt:P279* wd:Q57605562;
+     wdt:P279 ?o.
+  BIND(wdt:P279 AS ?p)
+}
+"""
+
+PROPERTIES_QUERY = """
+SELECT ?s ?p ?o
+WHERE {
+  ?s wikibase:propertyType wikibase:ExternalId;
+     wdt:P17 wd:Q408.
+  VALUES ?p { wikibase:propertyType wikibase:directClaim wdt:P17 rdfs:label }
+  ?s ?p ?o.
+  FILTER (?p != rdfs:label || lang(?o) = "en")
+}
+"""
+
+# Get the people with a value for a single identifier
+PEOPLE_QUERY = """
+SELECT ?s ?o
+WHERE {{
+  ?s wdt:{} ?o;
+     wdt:P31 wd:Q5.
+}}
+"""
+
+LABEL_SERVICE = re.compile(
+    r"SERVICE\s+wikibase:label\s*\{(?:[^{}]|\{[^{}]*\})*\}", flags=re.IGNORECASE
+)
+LABEL_LANGUAGE = re.compile(r'wikibase:language\s+"([^"]*)"')
+LABEL_VARIABLE = re.compile(r"\?(\w+)Label\b")
+LABEL_PATTERN = 'OPTIONAL {{ ?{var} rdfs:label ?{var}Label. FILTER (lang(?{var}Label) = "{lang}") }}'
+
+
+def binding_to_term(binding):
+    """
+    Convert a value in a set of SPARQL JSON results to an RDFLib term.
+    """
+    if binding["type"] == "uri":
+        return URIRef(binding["value"])
+    elif binding["type"] == "bnode":
+        return BNode(binding["value"])
+    return Literal(
+        binding["value"],
+        lang=binding.get("xml:lang"),
+        datatype=binding.get("datatype"),
+        normalize=False,
+    )
+
+
+def get_triples(query, endpoint=WIKIDATA_QUERY_SERVICE):
+    """
+    Run a query that returns ?s ?p ?o, yielding each result as an RDFLib triple.
+    """
+    results = run_query(query, endpoint)
+    for binding in results["results"]["bindings"]:
+        yield tuple(binding_to_term(binding[v]) for v in ["s", "p", "o"])
+
+
+def extract_subset(output=OUTPUT_PATH, endpoint=WIKIDATA_QUERY_SERVICE, **kwargs):
+    """
+    Extract the parts of Wikidata used by the notebooks and save them as compressed N-Triples.
+
+    Parameters:
+        output: the path of the file to create
+        endpoint: url of the SPARQL endpoint
+        kwargs: passed to `wikidata_tools.harvest.Harvester` (eg `checkpoint` or `max_workers`)
+
+    Returns:
+        The number of triples saved
+    """
+    graph = Graph()
+    for query in [AGENCIES_QUERY, CLASSES_QUERY, PROPERTIES_QUERY]:
+        for triple in get_triples(query, endpoint):
+            graph.add(triple)
+    # People are harvested one identifier at a time, so each query stays small
+    properties = sorted(
+        str(o).split("/")[-1]
+        for o in graph.objects(predicate=PREFIXES["wikibase"].directClaim)
+    )
+    harvester = Harvester(endpoint=endpoint, **kwargs)
+    results = harvester.harvest({p: PEOPLE_QUERY.format(p) for p in properties})
+    for prop, df in results.items():
+        for item, value in zip(df["s"].astype(str), df["o"].astype(str)):
+            graph.add((URIRef(item), WDT[prop], Literal(value)))
+            graph.add((URIRef(item), WDT.P31, WD.Q5))
+    # Write to a temporary file first so a failed extract doesn't replace a good one
+    output = Path(output)
+    tmp_path = output.with_name(f"{output.name}.tmp")
+    with gzip.open(tmp_path, "wb") as nt_file:
+        graph.serialize(nt_file, format="nt", encoding="utf-8")
+    tmp_path.replace(output)
+    return len(graph)
+
+
+_graphs = {}
+_lock = threading.Lock()
+
+
+def load_graph(path):
+    """
+    Load an extract into an in-memory graph. Graphs are kept for reuse until the
+    extract file is changed.
+    """
+    path = Path(path)
+    key = (path.resolve(), path.stat().st_mtime_ns)
+    with _lock:
+        if key not in _graphs:
+            graph = Graph()
+            opener = gzip.open if path.suffix == ".gz" else open
+            # Keep values in the same form as the Query Service's results
+            rdflib.NORMALIZE_LITERALS = False
+            try:
+                with opener(path, "rb") as nt_file:
+                    graph.parse(nt_file, format="nt")
+            finally:
+                rdflib.NORMALIZE_LITERALS = True
+            # Only keep the current version of each extract
+            for old_key in [k for k in _graphs if k[0] == key[0]]:
+                del _graphs[old_key]
+            _graphs[key] = graph
+        return _graphs[key]
+
+
+def replace_label_service(query):
+    """
+    Replace the Query Service's label service with optional `rdfs:label` patterns
+    for each of the `?<variable>Label` variables in the query.
+    """
+    match = LABEL_SERVICE.search(query)
+    if not match:
+        return query
+    languages = LABEL_LANGUAGE.search(match.group(0))
+    languages = languages.group(1).split(",") if languages else []
+    # Use the first specific language, ignoring placeholders like [AUTO_LANGUAGE]
+    lang = next(
+        (lg.strip() for lg in languages if not lg.strip().startswith("[")), "en"
+    )
+    start, end = match.span()
+    before = query[:start]
+    after = query[end:]
+    variables = dict.fromkeys(LABEL_VARIABLE.findall(before + after))
+    patterns = "\n".join(LABEL_PATTERN.format(var=v, lang=lang) for v in variables)
+    return before + patterns + after
+
+
+def query_local(query, path):
+    """
+    Run a SPARQL query against a local extract.
+
+    Parameters:
+        query: the SPARQL query
+        path: the location of the extract
+
+    Returns:
+        The results in the SPARQL JSON format, as bytes
+    """
+    graph = load_graph(path)
+    results = graph.query(replace_label_service(query), initNs=PREFIXES)
+    return results.serialize(format="json")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Extract the parts of Wikidata used by the notebooks for querying offline."
+    )
+    parser.add_argument(
+        "--output", default=OUTPUT_PATH, help="Path of the N-Triples file to create"
+    )
+    parser.add_argument(
+        "--endpoint", default=WIKIDATA_QUERY_SERVICE, help="SPARQL endpoint to query"
+    )
+    parser.add_argument(
+        "--checkpoint", help="File to save completed results, so an extract can resume"
+    )
+    args = parser.parse_args()
+    count = extract_subset(args.output, args.endpoint, checkpoint=args.checkpoint)
+    print(f"Saved {count} triples to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,261 @@
+"""
+Record how long the queries and rendering steps in the notebooks take.
+
+SPARQL requests (see `wikidata_tools.sparql`) and the graph, layout and chart builders
+record an event for each call. Events include the time taken and other details like the
+size of the response, the number of rows, whether the response came from the cache, and
+any retries. Events are:
+
+* logged as JSON to the `wikidata_tools.metrics` logger (set `GW_METRICS_LOG` to the
+  path of a file to save them)
+* summarised as a dataframe by `Metrics.summary()`, for display in a notebook
+* available in the Prometheus text format from `Metrics.prometheus_text()`, or over HTTP
+  using `serve_metrics()` (eg from an app served by Voila)
+
+Only the most recent events are kept in memory, but the totals for each stage include
+every event.
+"""
+
+import datetime
+import functools
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pandas as pd
+
+LOG_PATH = os.getenv("GW_METRICS_LOG")
+METRICS_PORT = os.getenv("GW_METRICS_PORT")
+MAX_EVENTS = 10000
+
+# Numeric fields that are added up in the totals
+TOTAL_FIELDS = ["bytes", "rows", "retries"]
+
+logger = logging.getLogger(__name__)
+if LOG_PATH:
+    handler = logging.FileHandler(LOG_PATH)
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+
+
+class Metrics:
+    """
+    A thread-safe collection of timing events.
+
+    Parameters:
+        max_events: the number of recent events to keep
+    """
+
+    def __init__(self, max_events=MAX_EVENTS):
+        self.events = deque(maxlen=max_events)
+        self.totals = {}
+        self.lock = threading.Lock()
+
+    def record(self, stage, seconds, name=None, **fields):
+        """
+        Record an event.
+
+        Parameters:
+            stage: the type of event (eg 'sparql', 'parse', 'render')
+            seconds: the time taken
+            name: an identifier for the query, file or chart (optional)
+            fields: other details (eg `bytes`, `rows`, `cache`, `retries`)
+
+        Returns:
+            The event as a dict
+        """
+        event = {
+            "time": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            "stage": stage,
+            "name": name,
+            "seconds": seconds,
+            **fields,
+        }
+        with self.lock:
+            self.events.append(event)
+            totals = self.totals.setdefault(
+                stage,
+                {
+                    "count": 0,
+                    "seconds": 0,
+                    "max_seconds": 0,
+                    "cache_hits": 0,
+                    "errors": 0,
+                }
+                | {f: 0 for f in TOTAL_FIELDS},
+            )
+            totals["count"] += 1
+            totals["seconds"] += seconds
+            totals["max_seconds"] = max(totals["max_seconds"], seconds)
+            totals["cache_hits"] += fields.get("cache") == "hit"
+            totals["errors"] += "error" in fields
+            for field in TOTAL_FIELDS:
+                totals[field] += fields.get(field) or 0
+        logger.info(json.dumps(event, default=str))
+        return event
+
+    @contextmanager
+    def timer(self, stage, name=None, **fields):
+        """
+        Time a block of code, recording it as an event when it finishes.
+        Yields a dict that can be used to add details to the event, eg:
+
+            with metrics.timer("parse") as event:
+                df = parse_results(data)
+                event["rows"] = len(df)
+        """
+        start = time.perf_counter()
+        try:
+            yield fields
+        except Exception as e:
+            fields["error"] = type(e).__name__
+            raise
+        finally:
+            self.record(stage, time.perf_counter() - start, name=name, **fields)
+
+    def summary(self, by_name=False):
+        """
+        Summarise the recorded events.
+
+        Parameters:
+            by_name: summarise the recent events for each query, file or chart,
+                rather than the totals for each stage
+
+        Returns:
+            A dataframe with a row for each stage (or stage and name)
+        """
+        if by_name:
+            with self.lock:
+                df = pd.DataFrame(list(self.events))
+            if df.empty:
+                return df
+            df = df.reindex(columns=["stage", "name", "seconds"] + TOTAL_FIELDS)
+            return (
+                df.groupby(["stage", "name"], dropna=False)
+                .agg(
+                    count=("seconds", "size"),
+                    seconds=("seconds", "sum"),
+                    max_seconds=("seconds", "max"),
+                    **{f: (f, "sum") for f in TOTAL_FIELDS},
+                )
+                .sort_values("seconds", ascending=False)
+                .reset_index()
+            )
+        with self.lock:
+            df = pd.DataFrame.from_dict(self.totals, orient="index")
+        if df.empty:
+            return df
+        df.insert(3, "mean_seconds", df["seconds"] / df["count"])
+        return df.rename_axis("stage").sort_values("seconds", ascending=False)
+
+    def prometheus_text(self, prefix="glam_workbench"):
+        """
+        Get the totals for each stage in the Prometheus text exposition format.
+        """
+        metrics = [
+            ("calls_total", "count", "Number of events"),
+            ("seconds_total", "seconds", "Time spent"),
+            ("max_seconds", "max_seconds", "Longest event"),
+            ("cache_hits_total", "cache_hits", "Responses loaded from the cache"),
+            ("errors_total", "errors", "Events that raised an exception"),
+            ("bytes_total", "bytes", "Size of responses and files"),
+            ("rows_total", "rows", "Number of result rows"),
+            ("retries_total", "retries", "Number of retried requests"),
+        ]
+        with self.lock:
+            totals = {stage: dict(values) for stage, values in self.totals.items()}
+        lines = []
+        for suffix, field, description in metrics:
+            metric = f"{prefix}_{suffix}"
+            metric_type = "gauge" if suffix == "max_seconds" else "counter"
+            lines += [
+                f"# HELP {metric} {description}",
+                f"# TYPE {metric} {metric_type}",
+            ]
+            for stage, values in sorted(totals.items()):
+                lines.append(f'{metric}{{stage="{stage}"}} {values[field]}')
+        return "\n".join(lines) + "\n"
+
+    def reset(self):
+        with self.lock:
+            self.events.clear()
+            self.totals = {}
+
+
+_metrics = None
+
+
+def get_metrics():
+    """
+    Get the shared metrics collection, creating it if necessary.
+    """
+    global _metrics
+    if _metrics is None:
+        _metrics = Metrics()
+    return _metrics
+
+
+def instrument(stage, details=None):
+    """
+    A decorator that records the time taken by each call to a function.
+
+    Parameters:
+        stage: the name of the stage to record
+        details: an optional function that's passed the function's arguments and
+            result, and returns a dict of extra details to record (eg the number of rows)
+    """
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with get_metrics().timer(stage, name=func.__name__) as event:
+                result = func(*args, **kwargs)
+                if details:
+                    event.update(details(result, *args, **kwargs))
+                return result
+
+        return wrapper
+
+    return decorator
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = get_metrics().prometheus_text().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve_metrics(port=METRICS_PORT, host="127.0.0.1"):
+    """
+    Serve the metrics at `http://<host>:<port>/metrics` from a background thread.
+    Nothing is served unless a port is given (or set using `GW_METRICS_PORT`).
+
+    Returns:
+        The server, or None if it wasn't started
+    """
+    if not port:
+        return None
+    try:
+        server = ThreadingHTTPServer((host, int(port)), MetricsHandler)
+    except OSError as e:
+        # Another kernel (eg a second Voila session) might already be using the port
+        logger.warning(f"Couldn't serve metrics on port {port}: {e}")
+        return None
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
@@ -0,0 +1,121 @@
+"""
+A bounded cache of rendered results that's filled by a background thread.
+
+Interactive notebooks can use this to prepare the results a user is likely to ask for
+next (eg graphs of neighbouring items in a dropdown list) while they're looking at the
+current one. Results are kept in a least recently used (LRU) cache of a fixed size.
+Keys can be queued at two priorities:
+
+* priority keys (eg neighbours of the current selection) are rendered first, most recently
+  queued first, and older requests are dropped if too many are waiting
+* background keys (eg every option in a list) are only rendered while there's room in the
+  cache, so they never push out results that have actually been used
+"""
+
+import threading
+from collections import OrderedDict, deque
+
+
+class PrefetchCache:
+    """
+    An LRU cache of results created by a render function, with a background worker.
+
+    Parameters:
+        render: a function that creates a result from the values of a key, eg `render(*key)`
+        maxsize: the maximum number of results to keep
+    """
+
+    def __init__(self, render, maxsize=100):
+        self.render = render
+        self.maxsize = maxsize
+        self.results = OrderedDict()
+        # Keys being rendered, with an event that's set when the rendering is finished
+        self.rendering = {}
+        self.queue = deque(maxlen=maxsize)
+        self.background = deque()
+        self.condition = threading.Condition()
+        self.worker = None
+
+    def __contains__(self, key):
+        with self.condition:
+            return key in self.results
+
+    def __len__(self):
+        with self.condition:
+            return len(self.results)
+
+    def get(self, key):
+        """
+        Get the result for a key, rendering it now if it's not already in the cache.
+        If the key is being rendered by the background worker, wait for it to finish.
+        """
+        while True:
+            with self.condition:
+                if key in self.results:
+                    self.results.move_to_end(key)
+                    return self.results[key]
+                event = self.rendering.get(key)
+                if event is None:
+                    event = self.rendering[key] = threading.Event()
+                    break
+            event.wait()
+        try:
+            result = self.render(*key)
+        except Exception:
+            with self.condition:
+                del self.rendering[key]
+            event.set()
+            raise
+        # Store the result before anyone waiting for it is woken up
+        with self.condition:
+            self.results[key] = result
+            while len(self.results) > self.maxsize:
+                self.results.popitem(last=False)
+            del self.rendering[key]
+        event.set()
+        return result
+
+    def prefetch(self, keys, background=False):
+        """
+        Queue keys to be rendered by the background worker.
+
+        Parameters:
+            keys: a list of keys, in order of priority
+            background: only render these keys if there's room in the cache,
+                after all the priority keys have been rendered
+        """
+        with self.condition:
+            if background:
+                self.background.extend(keys)
+            else:
+                # Put the new keys in front of any that are still waiting
+                self.queue.extendleft(reversed(keys))
+            self.condition.notify()
+            if self.worker is None:
+                self.worker = threading.Thread(target=self.run, daemon=True)
+                self.worker.start()
+
+    def next_key(self):
+        """
+        Get the next key for the worker to render, or None if there's nothing to do.
+        Must be called while holding the condition lock.
+        """
+        while self.queue:
+            key = self.queue.popleft()
+            if key not in self.results and key not in self.rendering:
+                return key
+        while self.background and len(self.results) < self.maxsize:
+            key = self.background.popleft()
+            if key not in self.results and key not in self.rendering:
+                return key
+
+    def run(self):
+        while True:
+            with self.condition:
+                while (key := self.next_key()) is None:
+                    self.condition.wait()
+            try:
+                self.get(key)
+            except Exception:
+                # The error will be raised again if the key is requested with get()
+                pass
@@ -0,0 +1,96 @@
+"""
+Convert SPARQL JSON results into dataframes with typed columns.
+
+`pd.json_normalize()` walks every binding as a nested dict and creates `_type`, `_value`
+and `xml:lang` columns for every variable, all stored as strings. Here each variable is
+converted to a single column in one pass over the bindings, using the datatypes in the
+results to create datetime and numeric columns, and categories for repeated URIs.
+"""
+
+import json
+
+import pandas as pd
+
+XSD = "http://www.w3.org/2001/XMLSchema#"
+DATE_TYPES = [f"{XSD}dateTime", f"{XSD}date"]
+INTEGER_TYPES = [
+    f"{XSD}integer",
+    f"{XSD}int",
+    f"{XSD}long",
+    f"{XSD}short",
+    f"{XSD}nonNegativeInteger",
+    f"{XSD}positiveInteger",
+]
+FLOAT_TYPES = [f"{XSD}decimal", f"{XSD}double", f"{XSD}float"]
+BOOLEAN_TYPES = [f"{XSD}boolean"]
+NUMERIC_TYPES = set(INTEGER_TYPES + FLOAT_TYPES)
+
+# Only use categories if values are repeated, on average, at least this many times
+CATEGORY_RATIO = 2
+
+
+def convert_column(values, types, datatypes):
+    """
+    Convert a list of binding values to a typed series.
+
+    Parameters:
+        values: the binding values (None where the variable is unbound)
+        types: the set of binding types (eg 'uri', 'literal') in the column
+        datatypes: the set of literal datatypes in the column
+
+    Returns:
+        A series
+    """
+    series = pd.Series(values, dtype="object")
+    if datatypes:
+        if datatypes <= set(DATE_TYPES):
+            # Dates outside the range pandas supports, or 'unknown value' blank nodes, become NaT
+            return pd.to_datetime(series, utc=True, format="ISO8601", errors="coerce")
+        elif datatypes <= set(INTEGER_TYPES):
+            numbers = pd.to_numeric(series, errors="coerce")
+            return numbers.astype("Int64" if numbers.isna().any() else "int64")
+        elif datatypes <= NUMERIC_TYPES:
+            # Columns that mix integers and decimals become floats
+            return pd.to_numeric(series, errors="coerce")
+        elif datatypes <= set(BOOLEAN_TYPES):
+            return series.map({"true": True, "false": False, "1": True, "0": False})
+    if types == {"uri"} and len(series) >= series.nunique() * CATEGORY_RATIO:
+        return series.astype("category")
+    return series
+
+
+def parse_results(results, typed=True, details=False):
+    """
+    Convert SPARQL JSON results to a dataframe, with a column for each variable.
+
+    Parameters:
+        results: the raw response (as bytes or a string) or the decoded JSON results
+        typed: convert values to datetimes, numbers, booleans and categories
+            using the information in the results
+        details: also add `<variable>_type` and `<variable>_lang` columns
+
+    Returns:
+        A dataframe
+    """
+    if isinstance(results, (bytes, str)):
+        results = json.loads(results)
+    variables = results["head"]["vars"]
+    bindings = results["results"]["bindings"]
+    columns = {}
+    for var in variables:
+        cells = [b.get(var) for b in bindings]
+        values = [c["value"] if c else None for c in cells]
+        if typed:
+            types = {c["type"] for c in cells if c}
+            datatypes = {c["datatype"] for c in cells if c and "datatype" in c}
+            columns[var] = convert_column(values, types, datatypes)
+        else:
+            columns[var] = pd.Series(values, dtype="object")
+        if details:
+            columns[f"{var}_type"] = pd.Series(
+                [c["type"] if c else None for c in cells], dtype="category"
+            )
+            columns[f"{var}_lang"] = pd.Series(
+                [c.get("xml:lang") if c else None for c in cells], dtype="category"
+            )
+    return pd.DataFrame(columns, index=pd.RangeIndex(len(bindings)))
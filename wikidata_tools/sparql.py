@@ -0,0 +1,284 @@
+"""
+A shared query layer for the Wikidata notebooks.
+
+Responses are cached on disk so that repeated runs of a notebook (including test runs
+with `pytest --nbval-lax`) don't have to go back to the Wikidata Query Service.
+Cache entries are keyed on the endpoint and a normalised version of the query text,
+expire after a configurable time, and the least recently used entries are removed
+once the cache grows beyond a set size.
+
+The cache and endpoint settings can be changed using environment variables (eg in a `.env` file):
+
+* `GW_SPARQL_CACHE_DIR` – directory to store cached responses (default `.sparql_cache`)
+* `GW_SPARQL_CACHE_TTL` – seconds before a cached response is refreshed (default 7 days)
+* `GW_SPARQL_CACHE_MAX_SIZE` – maximum size of the cache in bytes (default 500MB)
+* `GW_SPARQL_CACHE_ONLY` – if set to `true`, only use cached responses and never contact the endpoint
+* `GW_SPARQL_ENDPOINT` – the default endpoint (the Wikidata Query Service), or `file:<path>`
+  to use a local extract of Wikidata (see `wikidata_tools.local`)
+
+The time taken by each request and the size of each response are recorded using
+`wikidata_tools.metrics`.
+"""
+
+import hashlib
+import json
+import os
+import re
+import time
+from pathlib import Path
+from urllib.parse import urlparse
+
+from SPARQLWrapper import JSON, SPARQLWrapper
+
+from wikidata_tools.metrics import get_metrics
+from wikidata_tools.results import parse_results
+
+WIKIDATA_QUERY_SERVICE = "https://query.wikidata.org/sparql"
+WIKIDATA_ENDPOINT = os.getenv("GW_SPARQL_ENDPOINT", WIKIDATA_QUERY_SERVICE)
+
+CACHE_DIR = os.getenv("GW_SPARQL_CACHE_DIR", ".sparql_cache")
+CACHE_TTL = int(os.getenv("GW_SPARQL_CACHE_TTL", 7 * 24 * 60 * 60))
+CACHE_MAX_SIZE = int(os.getenv("GW_SPARQL_CACHE_MAX_SIZE", 500 * 1024 * 1024))
+CACHE_ONLY = os.getenv("GW_SPARQL_CACHE_ONLY", "").lower() in ["1", "true", "yes"]
+
+# Number of results to request at a time in `iter_pages()`
+PAGE_SIZE = 50000
+
+
+class CacheMiss(Exception):
+    """
+    Raised in cache-only mode when there's no cached response for a query.
+    """
+
+
+def normalise_query(query):
+    """
+    Normalise the text of a SPARQL query so that differences in indentation,
+    line breaks and comments don't produce different cache keys.
+    Whitespace inside string literals is left alone.
+    """
+    # Remove comment lines
+    query = re.sub(r"^\s*#.*$", "", query, flags=re.MULTILINE)
+    # Collapse runs of whitespace outside of quoted strings
+    query = re.sub(
+        r"(\"(?:[^\"\\]|\\.)*\"|'(?:[^'\\]|\\.)*')|\s+",
+        lambda m: m.group(1) or " ",
+        query,
+    )
+    return query.strip()
+
+
+def local_path(endpoint):
+    """
+    Get the path of a local extract from an endpoint like `file:<path>`,
+    or None if the endpoint isn't local.
+    """
+    if endpoint.startswith("file:"):
+        return Path(urlparse(endpoint).path)
+
+
+def cache_key(query, endpoint=WIKIDATA_ENDPOINT):
+    """
+    Create a cache key from the endpoint and the normalised query text.
+    Keys for local extracts include the extract's modification time, so
+    responses are refreshed when a new extract is made.
+    """
+    if (path := local_path(endpoint)) and path.exists():
+        endpoint = f"{endpoint}@{path.stat().st_mtime_ns}"
+    text = f"{endpoint}\n{normalise_query(query)}"
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class SparqlCache:
+    """
+    A directory of cached SPARQL responses, one file per query.
+    The file's modification time records when the response was fetched (used for expiry),
+    while its access time is updated on every read (used for LRU eviction).
+    """
+
+    def __init__(self, cache_dir=CACHE_DIR, ttl=CACHE_TTL, max_size=CACHE_MAX_SIZE):
+        self.cache_dir = Path(cache_dir)
+        self.ttl = ttl
+        self.max_size = max_size
+
+    def path(self, key):
+        return Path(self.cache_dir, f"{key}.json")
+
+    def get(self, key, ttl=None, allow_stale=False):
+        """
+        Get the cached response for the supplied key.
+
+        Parameters:
+            key: the cache key
+            ttl: override the default expiry time (in seconds)
+            allow_stale: return the response even if it has expired
+
+        Returns:
+            The raw response as bytes, or None if there's no current response.
+        """
+        path = self.path(key)
+        try:
+            stats = path.stat()
+        except FileNotFoundError:
+            return None
+        ttl = self.ttl if ttl is None else ttl
+        if not allow_stale and ttl is not None and time.time() - stats.st_mtime > ttl:
+            return None
+        data = path.read_bytes()
+        # Record the access for LRU eviction, keeping the original fetch time
+        os.utime(path, (time.time(), stats.st_mtime))
+        return data
+
+    def set(self, key, data):
+        """
+        Save a response to the cache, then remove old entries if the cache is too big.
+        """
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        path = self.path(key)
+        # Write to a temporary file first so readers never see a partial response
+        tmp_path = path.with_suffix(f".{os.getpid()}.tmp")
+        tmp_path.write_bytes(data)
+        tmp_path.replace(path)
+        self.evict()
+
+    def evict(self):
+        """
+        Remove the least recently used responses until the cache is within its size limit.
+        """
+        if not self.max_size:
+            return
+        entries = []
+        for path in self.cache_dir.glob("*.json"):
+            try:
+                entries.append((path, path.stat()))
+            except FileNotFoundError:
+                pass
+        total = sum(stats.st_size for _, stats in entries)
+        for path, stats in sorted(entries, key=lambda e: e[1].st_atime):
+            if total <= self.max_size:
+                break
+            path.unlink(missing_ok=True)
+            total -= stats.st_size
+
+    def clear(self):
+        """
+        Remove all cached responses.
+        """
+        for path in self.cache_dir.glob("*.json"):
+            path.unlink(missing_ok=True)
+
+
+_cache = None
+
+
+def get_cache():
+    """
+    Get the shared cache, creating it if necessary.
+    """
+    global _cache
+    if _cache is None:
+        _cache = SparqlCache()
+    return _cache
+
+
+def fetch_response(query, endpoint=WIKIDATA_ENDPOINT):
+    """
+    Send a query to the endpoint and return the raw JSON response.
+    """
+    if path := local_path(endpoint):
+        # Imported here because wikidata_tools.local uses this module to create extracts
+        from wikidata_tools.local import query_local
+
+        return query_local(query, path)
+    sparql = SPARQLWrapper(endpoint)
+    sparql.setQuery(query)
+    sparql.setReturnFormat(JSON)
+    return sparql.query().response.read()
+
+
+def get_response(
+    query, endpoint=WIKIDATA_ENDPOINT, ttl=None, cache_only=None, use_cache=True
+):
+    """
+    Get the raw JSON response to a query, using the cache where possible.
+
+    Parameters:
+        query: the SPARQL query
+        endpoint: url of the SPARQL endpoint
+        ttl: override the default expiry time of cached responses (in seconds)
+        cache_only: only use cached responses (defaults to the value of GW_SPARQL_CACHE_ONLY)
+        use_cache: set to False to bypass the cache completely
+
+    Returns:
+        The response as bytes
+    """
+    key = cache_key(query, endpoint)
+    # Record the time taken, the size of the response and whether it came from the cache
+    with get_metrics().timer("sparql", name=key[:12]) as event:
+        if not use_cache:
+            event["cache"] = "bypass"
+            data = fetch_response(query, endpoint)
+        else:
+            cache = get_cache()
+            cache_only = CACHE_ONLY if cache_only is None else cache_only
+            data = cache.get(key, ttl=ttl, allow_stale=cache_only)
+            event["cache"] = "hit"
+            if data is None:
+                event["cache"] = "miss"
+                if cache_only:
+                    raise CacheMiss(
+                        f"No cached response for query: {normalise_query(query)}"
+                    )
+                data = fetch_response(query, endpoint)
+                cache.set(key, data)
+        event["bytes"] = len(data)
+    return data
+
+
+def run_query(query, endpoint=WIKIDATA_ENDPOINT, **kwargs):
+    """
+    Run a SPARQL query, returning the decoded JSON results.
+    This is a replacement for `sparql.query().convert()`.
+    Accepts the same keyword arguments as `get_response()`.
+    """
+    return json.loads(get_response(query, endpoint, **kwargs))
+
+
+def get_dataframe(
+    query, endpoint=WIKIDATA_ENDPOINT, typed=True, details=False, **kwargs
+):
+    """
+    Run a SPARQL query, returning the results as a dataframe with a column for each variable.
+    This is a replacement for `SPARQLWrapper.sparql_dataframe.get_sparql_dataframe()`
+    and `pd.json_normalize()`. See `wikidata_tools.results.parse_results()` for
+    the `typed` and `details` options.
+    Accepts the same keyword arguments as `get_response()`.
+    """
+    data = get_response(query, endpoint, **kwargs)
+    with get_metrics().timer("parse", name=cache_key(query, endpoint)[:12]) as event:
+        df = parse_results(data, typed=typed, details=details)
+        event["rows"] = len(df)
+    return df
+
+
+def iter_pages(query, endpoint=WIKIDATA_ENDPOINT, page_size=PAGE_SIZE, **kwargs):
+    """
+    Run a query one page at a time (using LIMIT and OFFSET), yielding a dataframe
+    for each page of results. Large result sets can then be processed in chunks,
+    and each request is small enough to finish within the endpoint's time limit.
+
+    The query should include an ORDER BY clause, otherwise the endpoint might not
+    return results in the same order each time, and pages could overlap.
+    Pages are cached separately, so an interrupted harvest picks up where it stopped.
+    Accepts the same keyword arguments as `get_dataframe()`.
+    """
+    offset = 0
+    while True:
+        df = get_dataframe(
+            f"{query}\nLIMIT {page_size} OFFSET {offset}", endpoint, **kwargs
+        )
+        if not df.empty:
+            yield df
+        if len(df) < page_size:
+            break
+        offset += page_size
@@ -0,0 +1,280 @@
+"""
+A local store of Australian government agency data, kept up to date with Wikidata.
+
+The agency notebooks all use the same small set of facts about agencies (NAA identifiers,
+labels, start and end dates, and 'replaces'/'replaced by' statements). Rather than
+downloading all of them on every run, they're saved in a SQLite database along with
+each item's modification date (`schema:dateModified`). A refresh only asks Wikidata for
+a list of agency identifiers and modification dates, then fetches the details of items
+that are new or have changed since they were stored. Items that no longer have an NAA
+identifier are removed.
+
+The location of the database can be changed using the `GW_AGENCY_STORE` environment variable
+(default `.agency_store.sqlite`).
+"""
+
+import os
+import sqlite3
+from contextlib import closing
+
+import pandas as pd
+
+from wikidata_tools.agencies import parse_dates
+from wikidata_tools.lineage import ENTITY_PREFIX, PROP_PREFIX, strip_prefix
+from wikidata_tools.metrics import instrument
+from wikidata_tools.sparql import WIKIDATA_ENDPOINT, get_dataframe
+
+STORE_PATH = os.getenv("GW_AGENCY_STORE", ".agency_store.sqlite")
+
+# Number of changed items to include in each details query
+BATCH_SIZE = 200
+# If more than this proportion of items have changed, get the details of all items at once
+FULL_FETCH_RATIO = 0.5
+
+ITEMS_QUERY = """
+SELECT ?agency ?id ?modified
+WHERE {
+  ?agency wdt:P10856 ?id;
+          schema:dateModified ?modified.
+}
+"""
+
+DETAILS_QUERY = """
+SELECT DISTINCT ?agency ?name ?start_date ?end_date ?direct ?subclass
+WHERE {{
+  {}
+  ?agency wdt:P10856 [];
+          wdt:P571 ?start_date.
+  OPTIONAL {{ ?agency rdfs:label ?name. FILTER (lang(?name) = "en") }}
+  OPTIONAL {{ ?agency wdt:P576 ?end_date. }}
+  BIND(EXISTS {{ ?agency wdt:P31 wd:Q57605562 }} AS ?direct)
+  BIND(EXISTS {{ ?agency wdt:P31/wdt:P279* wd:Q57605562 }} AS ?subclass)
+}}
+"""
+
+EDGES_QUERY = """
+SELECT DISTINCT ?agency ?property ?other
+WHERE {{
+  {}
+  ?agency wdt:P10856 [].
+  VALUES ?property {{ wdt:P1365 wdt:P1366 }}
+  ?agency ?property ?other.
+}}
+"""
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS items (agency TEXT, id TEXT, modified TEXT);
+CREATE TABLE IF NOT EXISTS details (
+    agency TEXT, name TEXT, start_date TEXT, end_date TEXT, direct TEXT, subclass TEXT
+);
+CREATE TABLE IF NOT EXISTS edges (agency TEXT, property TEXT, other TEXT);
+CREATE INDEX IF NOT EXISTS items_agency ON items (agency);
+CREATE INDEX IF NOT EXISTS details_agency ON details (agency);
+CREATE INDEX IF NOT EXISTS edges_agency ON edges (agency);
+"""
+
+AGENCY_COLUMNS = [
+    "agency",
+    "name",
+    "label",
+    "id",
+    "start_date",
+    "end_date",
+    "modified",
+]
+
+
+def values_clause(agencies):
+    return "VALUES ?agency {{ {} }}".format(" ".join(f"wd:{a}" for a in agencies))
+
+
+def year_string(series):
+    """
+    Get the year from a column of ISO dates as a string, without leading zeros.
+    Missing or unknown values become an empty string.
+    """
+    return (
+        series.str.extract(r"^(-?\d+)-", expand=False)
+        .str.replace(r"^(-?)0+(?=\d)", r"\1", regex=True)
+        .fillna("")
+    )
+
+
+class AgencyStore:
+    """
+    A SQLite database of agency details and lineage statements.
+
+    Parameters:
+        path: location of the database
+        endpoint: url of the SPARQL endpoint
+    """
+
+    def __init__(self, path=STORE_PATH, endpoint=WIKIDATA_ENDPOINT):
+        self.path = path
+        self.endpoint = endpoint
+        # Numbers of items added, updated and removed by the last refresh
+        self.changes = {}
+        with closing(self.connect()) as conn:
+            conn.executescript(SCHEMA)
+
+    def connect(self):
+        # Notebooks can be run in parallel, so wait for other writers to finish
+        return sqlite3.connect(self.path, timeout=60)
+
+    def get_modified(self):
+        """
+        Get the stored modification dates, as a dict keyed by Wikidata identifier.
+        """
+        with closing(self.connect()) as conn:
+            return dict(
+                conn.execute("SELECT agency, MAX(modified) FROM items GROUP BY agency")
+            )
+
+    def fetch(self, query, agencies=None):
+        """
+        Run a details or edges query, either for all items or for a list of items
+        (in batches).
+        """
+        if agencies is None:
+            batches = [""]
+        else:
+            agencies = sorted(agencies)
+            batches = []
+            for start in range(0, len(agencies), BATCH_SIZE):
+                end = start + BATCH_SIZE
+                batches.append(values_clause(agencies[start:end]))
+        dfs = [
+            get_dataframe(query.format(batch), self.endpoint, typed=False, ttl=0)
+            for batch in batches
+        ]
+        df = pd.concat(dfs, ignore_index=True)
+        df["agency"] = strip_prefix(df["agency"], ENTITY_PREFIX)
+        return df
+
+    @instrument("store_refresh", lambda store, *args, **kwargs: store.changes)
+    def refresh(self):
+        """
+        Update the store with items that have been added, modified or removed
+        since it was last refreshed.
+        """
+        items = get_dataframe(ITEMS_QUERY, self.endpoint, typed=False, ttl=0)
+        items["agency"] = strip_prefix(items["agency"], ENTITY_PREFIX)
+        current = items.groupby("agency")["modified"].max().to_dict()
+        stored = self.get_modified()
+        changed = [a for a, m in current.items() if stored.get(a) != m]
+        removed = [a for a in stored if a not in current]
+        full = len(changed) > len(current) * FULL_FETCH_RATIO
+        if changed:
+            details = self.fetch(DETAILS_QUERY, None if full else changed)
+            edges = self.fetch(EDGES_QUERY, None if full else changed)
+            edges["other"] = strip_prefix(edges["other"], ENTITY_PREFIX)
+            edges["property"] = strip_prefix(edges["property"], PROP_PREFIX)
+        with closing(self.connect()) as conn, conn:
+            if full:
+                conn.execute("DELETE FROM details")
+                conn.execute("DELETE FROM edges")
+            else:
+                for table in ["details", "edges"]:
+                    conn.executemany(
+                        f"DELETE FROM {table} WHERE agency = ?",
+                        [(a,) for a in changed + removed],
+                    )
+            if changed:
+                conn.executemany(
+                    "INSERT INTO details VALUES (?, ?, ?, ?, ?, ?)",
+                    details[
+                        [
+                            "agency",
+                            "name",
+                            "start_date",
+                            "end_date",
+                            "direct",
+                            "subclass",
+                        ]
+                    ].itertuples(index=False),
+                )
+                conn.executemany(
+                    "INSERT INTO edges VALUES (?, ?, ?)",
+                    edges[["agency", "property", "other"]].itertuples(index=False),
+                )
+            # The list of items and their identifiers is small, so just replace it
+            conn.execute("DELETE FROM items")
+            conn.executemany(
+                "INSERT INTO items VALUES (?, ?, ?)",
+                items[["agency", "id", "modified"]].itertuples(index=False),
+            )
+        self.changes = {
+            "added": len([a for a in changed if a not in stored]),
+            "updated": len([a for a in changed if a in stored]),
+            "removed": len(removed),
+        }
+        return self
+
+    def get_agencies(self, instance=None, successors=False):
+        """
+        Get details of the stored agencies.
+
+        Parameters:
+            instance: limit the results to instances of Australian government agency
+                (Q57605562) – either 'direct' (P31) or 'subclass' (P31/P279*)
+            successors: add the Wikidata identifier (`after`) and NAA identifier (`after_id`)
+                of each agency's successors ('replaced by' statements)
+
+        Returns:
+            A dataframe with the columns `agency` (Wikidata identifier), `name` (English label),
+            `label` (name and date range), `id` (NAA identifier), `start_date`, `end_date`,
+            and `modified`
+        """
+        sql = "SELECT d.agency, d.name, i.id, d.start_date, d.end_date, i.modified FROM details d JOIN items i ON d.agency = i.agency"
+        if instance:
+            sql += f" WHERE d.{'subclass' if instance == 'subclass' else 'direct'} = 'true'"
+        with closing(self.connect()) as conn:
+            df = pd.read_sql_query(sql, conn)
+        # Combine the name and date range into a label, as in the original SPARQL queries
+        df["label"] = (
+            df["name"]
+            + " ("
+            + year_string(df["start_date"])
+            + "-"
+            + year_string(df["end_date"])
+            + ")"
+        )
+        for col in ["start_date", "end_date", "modified"]:
+            df[col] = parse_dates(df[col])
+        df = df[AGENCY_COLUMNS]
+        if successors:
+            # Successors are only included if they have an NAA identifier
+            ids = self.get_ids()
+            ids.columns = ["after", "after_id"]
+            edges = self.get_edges()
+            after = edges.loc[edges["property"] == "P1366", ["agency", "other"]]
+            after.columns = ["agency", "after"]
+            df = df.merge(after.merge(ids, on="after"), on="agency", how="left")
+        return df
+
+    def get_ids(self):
+        """
+        Get the NAA identifiers of all stored items.
+        """
+        with closing(self.connect()) as conn:
+            return pd.read_sql_query("SELECT DISTINCT agency, id FROM items", conn)
+
+    def get_edges(self):
+        """
+        Get the stored 'replaces' (P1365) and 'replaced by' (P1366) statements.
+        """
+        with closing(self.connect()) as conn:
+            return pd.read_sql_query("SELECT agency, property, other FROM edges", conn)
+
+
+_store = None
+
+
+def get_store():
+    """
+    Get the shared agency store, creating and refreshing it if necessary.
+    """
+    global _store
+    if _store is None:
+        _store = AgencyStore().refresh()
+    return _store